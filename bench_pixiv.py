@@ -0,0 +1,444 @@
+"""
+Offline benchmark for the crawler, downloader and report writer.
+
+Starts a local stand-in for the Pixiv app API and image host, then times
+run_sorter(), download_image() and generate_html() against it and reports
+pages/s, images/s, MB/s and peak RSS. Each scenario runs in its own
+process while the server stays in the parent, so peak RSS belongs to that
+scenario alone. The startup scenario
+times cold imports (python -X importtime) and the first search request
+from a fresh interpreter.
+
+    python bench_pixiv.py
+    python bench_pixiv.py --scenarios startup
+    python bench_pixiv.py --scenarios crawl --engine async --api_latency 0.1 --error_rate 0.05
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+
+SCENARIOS = ("crawl", "download", "html", "startup")
+
+def synthetic_illust(index, base_url, r18_ratio=0.1, manga_ratio=0.1):
+    """
+    A search_illust entry. Values are derived from 'index' so every run
+    (and every page request) sees the same data.
+    """
+    rng = random.Random(index)
+    illust_id = 100000000 - index
+    page_count = rng.randint(2, 5) if rng.random() < manga_ratio else 1
+    pages = [f"{base_url}/img/{illust_id}_p{n}.jpg" for n in range(page_count)]
+    return {
+        "id": illust_id,
+        "title": f"Illust {index}",
+        "type": "manga" if page_count > 1 else "illust",
+        "user": {"id": index % 500, "name": f"user{index % 500}", "account": f"user{index % 500}"},
+        "tags": [{"name": "bench", "translated_name": None}, {"name": f"tag{index % 20}", "translated_name": None}],
+        "create_date": time.strftime("%Y-%m-%dT%H:%M:%S+09:00", time.gmtime(1700000000 - index * 600)),
+        "page_count": page_count,
+        "x_restrict": 1 if rng.random() < r18_ratio else 0,
+        # Long-tailed like real bookmark counts
+        "total_bookmarks": int(rng.paretovariate(1.2) * 100),
+        "total_view": rng.randint(100, 100000),
+        "image_urls": {
+            "square_medium": f"{base_url}/thumb/{illust_id}.jpg",
+            "medium": f"{base_url}/thumb/{illust_id}.jpg",
+            "large": f"{base_url}/large/{illust_id}.jpg",
+        },
+        "meta_single_page": {"original_image_url": pages[0]} if page_count == 1 else {},
+        "meta_pages": [{"image_urls": {"original": url}} for url in pages] if page_count > 1 else [],
+    }
+
+class FakePixivServer:
+    """
+    Local HTTP server that answers /v1/search/illust like the app API
+    (30-item pages chained by next_url) and serves synthetic image bytes
+    with Range support. Latency and error rates are tunable.
+    """
+    def __init__(self, total=3000, page_size=30, r18_ratio=0.1, manga_ratio=0.1, duplicate_tail=True,
+                 image_kb=500, thumb_kb=20, api_latency=0.0, image_latency=0.0, error_rate=0.0, image_error_rate=0.0):
+        self.total = total
+        self.page_size = page_size
+        self.r18_ratio = r18_ratio
+        self.manga_ratio = manga_ratio
+        self.duplicate_tail = duplicate_tail
+        self.image_bytes = os.urandom(image_kb * 1024)
+        self.thumb_bytes = os.urandom(thumb_kb * 1024)
+        self.api_latency = api_latency
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.image_error_rate = image_error_rate
+        self.api_requests = 0
+        self.image_requests = 0
+        self.first_search_at = None
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/bench/stats":
+                    server._send(self, 200, json.dumps(server.stats()).encode())
+                elif path.startswith("/v1/search/illust"):
+                    server.handle_search(self)
+                else:
+                    server.handle_image(self, path)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {"api_requests": self.api_requests, "image_requests": self.image_requests, "first_search_at": self.first_search_at}
+
+    def _send(self, handler, status, body, content_type="application/json", headers=None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def handle_search(self, handler):
+        with self.lock:
+            self.api_requests += 1
+            if self.first_search_at is None:
+                self.first_search_at = time.time()
+        time.sleep(self.api_latency)
+        if random.random() < self.error_rate:
+            body = json.dumps({"error": {"message": "Rate Limit", "user_message": "", "reason": ""}}).encode()
+            self._send(handler, 403, body)
+            return
+
+        query = {key: values[-1] for key, values in parse_qs(urlparse(handler.path).query).items()}
+        offset = int(query.get("offset", 0))
+        last_offset = max(0, (self.total - 1) // self.page_size * self.page_size)
+        if offset > last_offset and self.duplicate_tail:
+            # The real API answers past-the-end offsets with its last page again
+            offset = last_offset
+        start, end = offset, min(offset + self.page_size, self.total)
+        illusts = [synthetic_illust(i, self.base_url, self.r18_ratio, self.manga_ratio) for i in range(start, end)]
+
+        next_url = None
+        if end < self.total or self.duplicate_tail:
+            next_query = dict(query, offset=int(query.get("offset", 0)) + self.page_size)
+            next_url = f"https://app-api.pixiv.net/v1/search/illust?{urlencode(next_query)}"
+        body = json.dumps({"illusts": illusts, "next_url": next_url, "search_span_limit": 31536000}).encode()
+        self._send(handler, 200, body)
+
+    def handle_image(self, handler, path):
+        with self.lock:
+            self.image_requests += 1
+        time.sleep(self.image_latency)
+        if random.random() < self.image_error_rate:
+            self._send(handler, 503, b"unavailable", content_type="text/plain")
+            return
+
+        data = self.thumb_bytes if path.startswith("/thumb/") else self.image_bytes
+        byte_range = handler.headers.get("Range")
+        if byte_range and byte_range.startswith("bytes="):
+            start = int(byte_range[6:].split("-")[0] or 0)
+            if start >= len(data):
+                self._send(handler, 416, b"", headers={"Content-Range": f"bytes */{len(data)}"})
+                return
+            self._send(handler, 206, data[start:], content_type="image/jpeg",
+                       headers={"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"})
+            return
+        self._send(handler, 200, data, content_type="image/jpeg")
+
+class RemoteServer:
+    """
+    A scenario process's handle on the FakePixivServer in the parent;
+    counters are read over HTTP from /bench/stats.
+    """
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def stats(self):
+        import urllib.request
+
+        with urllib.request.urlopen(f"{self.base_url}/bench/stats") as response:
+            return json.loads(response.read())
+
+def make_api(base_url):
+    """
+    An AppPixivAPI pointed at the fake server, authenticated without OAuth.
+    """
+    import requests
+    from pixivpy3 import AppPixivAPI
+
+    class BenchAPI(AppPixivAPI):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.hosts = base_url
+            self.requests = requests.Session()
+
+        def auth(self, username=None, password=None, refresh_token=None, headers=None):
+            self.set_auth("bench-access-token", "bench-refresh-token")
+            self.user_id = 1
+
+    return BenchAPI()
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def bench_crawl(server, args):
+    import pixiv_events
+    import pixiv_sorter
+
+    metrics = pixiv_events.Metrics()
+    bus = pixiv_events.EventBus()
+    bus.subscribe(metrics)
+    if args.verbose:
+        bus.subscribe(pixiv_events.print_logs)
+
+    options = dict(
+        threshold=args.threshold, pages=args.pages, delay=0.01, max_rate=args.max_rate,
+        auto_download=not args.no_download, per_host=args.per_host, report="html",
+        api=make_api(server.base_url), logger=bus,
+    )
+    started = time.perf_counter()
+    if args.engine == "async":
+        import pixiv_async
+        pixiv_async.run_sorter_blocking("bench", max_inflight=args.workers * 4, **options)
+    else:
+        pixiv_sorter.run_sorter("bench", download_workers=args.workers, prefetch_pages=args.prefetch, **options)
+    elapsed = time.perf_counter() - started
+
+    c = metrics.snapshot()
+    return {
+        "seconds": elapsed,
+        "pages": c["pages_fetched"],
+        "pages_per_s": c["pages_fetched"] / elapsed,
+        "hits": c["hits"],
+        "images": c["downloads_downloaded"],
+        "images_per_s": c["downloads_downloaded"] / elapsed,
+        "mb_per_s": c["download_bytes"] / (1024 * 1024) / elapsed,
+        "rate_limit_wait_s": c["rate_limit_wait_seconds"],
+        "api_requests": server.stats()["api_requests"],
+    }
+
+def bench_download(server, args):
+    import pixiv_sorter
+
+    illusts = [synthetic_illust(i, server.base_url, 0.0, args.manga_ratio) for i in range(args.download_count)]
+    os.makedirs("download", exist_ok=True)
+    session = pixiv_sorter.pixiv_http.get_session(pool_size=args.workers)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(lambda illust: pixiv_sorter.download_image(illust, "download", logger=lambda message: None, session=session), illusts))
+    elapsed = time.perf_counter() - started
+
+    written = sum(nbytes for _, nbytes in results)
+    files = sum(len(pixiv_sorter.get_original_pages(illust)) for illust in illusts)
+    return {
+        "seconds": elapsed,
+        "works": len(illusts),
+        "images": files,
+        "images_per_s": files / elapsed,
+        "mb_per_s": written / (1024 * 1024) / elapsed,
+        "failed": sum(1 for status, _ in results if status == "failed"),
+    }
+
+def bench_html(server, args):
+    import pixiv_sorter
+
+    illusts = [synthetic_illust(i, server.base_url) for i in range(args.html_cards)]
+    started = time.perf_counter()
+    path = pixiv_sorter.generate_html(illusts, "bench", args.threshold, filename="bench.html")
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": elapsed,
+        "cards": len(illusts),
+        "cards_per_s": len(illusts) / elapsed,
+        "mb_written": os.path.getsize(path) / (1024 * 1024),
+    }
+
+def import_times(module, package_dir):
+    """
+    Imports 'module' in a fresh interpreter under -X importtime. Returns its
+    cumulative import time in ms and its direct imports as (ms, name),
+    slowest first; (None, []) if the import fails.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=package_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    if completed.returncode != 0:
+        return None, []
+    children = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        # Lines come in post-order: a module's imports are listed right before it
+        if depth == 0:
+            if name == module:
+                return int(cumulative) / 1000, sorted(children, reverse=True)
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative) / 1000, name))
+    return None, []
+
+def bench_startup(server, args):
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    import_ms, children = import_times("pixiv_sorter", package_dir)
+    # Building the window needs a display; this is everything before it
+    gui_import_ms, _ = import_times("gui", package_dir)
+
+    script = (
+        "import bench_pixiv, pixiv_sorter\n"
+        f"client = pixiv_sorter.SearchClient(api=bench_pixiv.make_api({server.base_url!r}), logger=lambda message: None)\n"
+        "client.fetch_page(pixiv_sorter.first_search_query('bench'))\n"
+        "client.close()\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_dir, os.environ.get("PYTHONPATH")])))
+    started = time.time()
+    subprocess.run([sys.executable, "-c", script], env=env, check=True)
+    first_search_at = server.stats()["first_search_at"]
+    return {
+        "seconds": time.time() - started,
+        "import_ms": import_ms,
+        "gui_import_ms": gui_import_ms,
+        "first_request_ms": (first_search_at - started) * 1000 if first_search_at else None,
+        "slowest_imports": ", ".join(f"{name}={ms:.0f}ms" for ms, name in children[:5]),
+    }
+
+def start_server(args):
+    return FakePixivServer(
+        total=args.illusts, r18_ratio=args.r18_ratio, manga_ratio=args.manga_ratio,
+        duplicate_tail=not args.no_duplicate_tail, image_kb=args.image_kb,
+        api_latency=args.api_latency, image_latency=args.image_latency,
+        error_rate=args.error_rate, image_error_rate=args.image_error_rate,
+    ).start()
+
+def run_scenario(name, server, args):
+    """
+    Runs one scenario in a scratch directory against 'server' (a
+    FakePixivServer or RemoteServer) and returns its numbers.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, package_dir)
+    # Reports, downloads and state files go to a throwaway folder
+    workdir = tempfile.mkdtemp(prefix="pixiv-bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("PIXIV_REFRESH_TOKEN", "bench")
+    import webbrowser
+    webbrowser.open = lambda *args, **kwargs: False
+
+    try:
+        result = {"crawl": bench_crawl, "download": bench_download, "html": bench_html, "startup": bench_startup}[name](server, args)
+    finally:
+        os.chdir(package_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def format_result(name, result):
+    parts = []
+    for key, value in result.items():
+        if isinstance(value, float):
+            parts.append(f"{key}={value:.2f}")
+        elif value is not None:
+            parts.append(f"{key}={value}")
+    return f"{name:<9} " + "  ".join(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Pixiv Sorter against a local fake API and image server.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated scenarios to run (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--illusts", type=int, default=3000, help="Search results the fake API holds (default: 3000)")
+    parser.add_argument("--pages", type=int, default=30, help="Pages to crawl (default: 30)")
+    parser.add_argument("--threshold", type=int, default=300, help="Likes threshold for the crawl (default: 300)")
+    parser.add_argument("--r18_ratio", type=float, default=0.1, help="Share of R-18 results (default: 0.1)")
+    parser.add_argument("--manga_ratio", type=float, default=0.1, help="Share of multi-page works (default: 0.1)")
+    parser.add_argument("--no_duplicate_tail", action="store_true", help="End the next_url chain cleanly instead of repeating the last page")
+    parser.add_argument("--image_kb", type=int, default=500, help="Size of each synthetic original in KiB (default: 500)")
+    parser.add_argument("--api_latency", type=float, default=0.02, help="Seconds added to every search response (default: 0.02)")
+    parser.add_argument("--image_latency", type=float, default=0.01, help="Seconds added to every image response (default: 0.01)")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Share of search requests answered with a rate-limit error (default: 0)")
+    parser.add_argument("--image_error_rate", type=float, default=0.0, help="Share of image requests answered with HTTP 503 (default: 0)")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads", help="Engine for the crawl scenario (default: threads)")
+    parser.add_argument("--workers", type=int, default=8, help="Download workers (default: 8)")
+    parser.add_argument("--per_host", type=int, default=8, help="Concurrent downloads per host (default: 8)")
+    parser.add_argument("--prefetch", type=int, default=1, choices=(0, 1, 2), help="Search pages fetched ahead (default: 1)")
+    parser.add_argument("--max_rate", type=float, default=50.0, help="Search request rate ceiling (default: 50)")
+    parser.add_argument("--no_download", action="store_true", help="Crawl without downloading originals")
+    parser.add_argument("--download_count", type=int, default=200, help="Works in the download scenario (default: 200)")
+    parser.add_argument("--html_cards", type=int, default=5000, help="Cards in the report scenario (default: 5000)")
+    parser.add_argument("--verbose", action="store_true", help="Show the crawler's log output")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--server_url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        # Child process: run one scenario and hand the numbers back
+        print("BENCH " + json.dumps(run_scenario(args.scenario, RemoteServer(args.server_url), args)))
+        return
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    child_args = [arg for arg in sys.argv[1:] if arg != "--json"]
+    for name in names:
+        # A fresh server per scenario, so its counters start at zero
+        server = start_server(args)
+        try:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--scenario", name, "--server_url", server.base_url] + child_args,
+                stdout=subprocess.PIPE, text=True,
+            )
+        finally:
+            server.stop()
+        lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCH ")]
+        if args.verbose:
+            for line in completed.stdout.splitlines():
+                if not line.startswith("BENCH "):
+                    print(line)
+        if completed.returncode != 0 or not lines:
+            print(f"{name:<9} [!] failed (exit code {completed.returncode})")
+            continue
+        result = json.loads(lines[-1][len("BENCH "):])
+        print(json.dumps(dict(result, scenario=name)) if args.json else format_result(name, result))
+
+if __name__ == "__main__":
+    main()
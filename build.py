@@ -8,11 +8,13 @@ ctk_path = os.path.dirname(customtkinter.__file__)
 PyInstaller.__main__.run([
     'gui.py',
     '--name=PixivSorter',
-    '--onefile',
+    # One folder instead of one file: nothing to unpack on each launch
+    '--onedir',
+    '--noupx',
     '--noconsole',
     f'--add-data={ctk_path}{os.pathsep}customtkinter',
     f'--add-data=style.css{os.pathsep}.',
     '--clean',
 ])
 
-print("\n[+] Build complete! Check the 'dist' folder for PixivSorter.exe")
+print("\n[+] Build complete! Run dist/PixivSorter/PixivSorter.exe (ship the whole folder)")
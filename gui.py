@@ -3,7 +3,10 @@ import threading
 import sys
 import os
 import time
-from pixiv_sorter import run_sorter
+import queue
+from tkinter import filedialog
+from pixiv_sorter import run_sorter, run_batch, load_batch_file, preload
+import pixiv_events
 
 # Set appearance
 ctk.set_appearance_mode("Dark")
@@ -23,7 +26,7 @@ class PixivSorterGUI(ctk.CTk):
         # Create sidebar frame with widgets
         self.sidebar_frame = ctk.CTkFrame(self, width=300, corner_radius=0)
         self.sidebar_frame.grid(row=0, column=0, sticky="nsew")
-        self.sidebar_frame.grid_rowconfigure(9, weight=1)
+        self.sidebar_frame.grid_rowconfigure(10, weight=1)
 
         self.logo_label = ctk.CTkLabel(self.sidebar_frame, text="Pixiv Sorter", font=ctk.CTkFont(size=24, weight="bold"))
         self.logo_label.grid(row=0, column=0, padx=20, pady=(20, 10))
@@ -68,19 +71,25 @@ class PixivSorterGUI(ctk.CTk):
         self.auto_download_switch = ctk.CTkSwitch(self.sidebar_frame, text="Auto-Download Images", progress_color="green")
         self.auto_download_switch.grid(row=8, column=0, padx=20, pady=10, sticky="w")
 
+        self.resume_switch = ctk.CTkSwitch(self.sidebar_frame, text="Resume Last Crawl")
+        self.resume_switch.grid(row=9, column=0, padx=20, pady=10, sticky="w")
+
         # Delay
         self.delay_label = ctk.CTkLabel(self.sidebar_frame, text="Delay (seconds): 2.5", anchor="w")
-        self.delay_label.grid(row=9, column=0, padx=20, pady=(10, 0), sticky="w")
+        self.delay_label.grid(row=10, column=0, padx=20, pady=(10, 0), sticky="w")
         self.delay_slider = ctk.CTkSlider(self.sidebar_frame, from_=0.5, to=10, number_of_steps=19, command=self.update_delay_label)
         self.delay_slider.set(2.5)
-        self.delay_slider.grid(row=10, column=0, padx=20, pady=(0, 10), sticky="ew")
+        self.delay_slider.grid(row=11, column=0, padx=20, pady=(0, 10), sticky="ew")
 
         # Action Buttons
         self.run_button = ctk.CTkButton(self.sidebar_frame, text="Run Search", font=ctk.CTkFont(weight="bold"), command=self.start_search)
-        self.run_button.grid(row=11, column=0, padx=20, pady=10)
+        self.run_button.grid(row=12, column=0, padx=20, pady=10)
+
+        self.batch_button = ctk.CTkButton(self.sidebar_frame, text="Run Batch File...", fg_color="transparent", border_width=1, command=self.start_batch)
+        self.batch_button.grid(row=13, column=0, padx=20, pady=(0, 10))
 
         self.clear_button = ctk.CTkButton(self.sidebar_frame, text="Clear Logs", fg_color="transparent", border_width=1, command=self.clear_logs)
-        self.clear_button.grid(row=12, column=0, padx=20, pady=(0, 20))
+        self.clear_button.grid(row=14, column=0, padx=20, pady=(0, 20))
 
         # Main logging area
         self.main_frame = ctk.CTkFrame(self, corner_radius=0)
@@ -93,22 +102,59 @@ class PixivSorterGUI(ctk.CTk):
 
         self.log_textbox = ctk.CTkTextbox(self.main_frame, font=ctk.CTkFont(family="Consolas", size=12))
         self.log_textbox.grid(row=1, column=0, padx=20, pady=10, sticky="nsew")
+
+        self.status_label = ctk.CTkLabel(self.main_frame, text="", anchor="w")
+        self.status_label.grid(row=2, column=0, padx=20, pady=(0, 10), sticky="w")
         
         self.is_running = False
 
+        # Worker threads only push onto the queue; the Tk thread drains it on a timer
+        self.log_queue = queue.Queue()
+        self.metrics = pixiv_events.Metrics()
+        self.events = pixiv_events.EventBus()
+        self.events.subscribe(self._on_event)
+        self.after(self.LOG_INTERVAL_MS, self._drain_log)
+        # The HTTP stack loads once the window is up, before the first search needs it
+        self.after_idle(lambda: threading.Thread(target=preload, daemon=True).start())
+
     def update_delay_label(self, value):
         self.delay_label.configure(text=f"Delay (seconds): {value:.1f}")
 
     def clear_logs(self):
         self.log_textbox.delete("1.0", "end")
 
+    LOG_INTERVAL_MS = 100
+
     def log(self, message):
         # Thread-safe logging
-        self.after(0, lambda: self._do_log(message))
+        self.log_queue.put(str(message))
 
-    def _do_log(self, message):
-        self.log_textbox.insert("end", str(message) + "\n")
-        self.log_textbox.see("end")
+    def _on_event(self, event):
+        if event.kind == pixiv_events.LOG:
+            self.log_queue.put(event.data["message"])
+        else:
+            self.metrics(event)
+
+    def _drain_log(self):
+        # One insert per tick however many lines arrived, so fast crawls
+        # don't flood the Tk event loop
+        lines = []
+        while True:
+            try:
+                lines.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if lines:
+            self.log_textbox.insert("end", "\n".join(lines) + "\n")
+            self.log_textbox.see("end")
+        if self.is_running:
+            c = self.metrics.snapshot()
+            self.status_label.configure(text=(
+                f"Pages: {c['pages_fetched'] + c['pages_cached']}   Hits: {c['hits']}   "
+                f"Downloads: {c['downloads_downloaded']} ({c['download_bytes'] / (1024 * 1024):.1f} MB)   "
+                f"Rate-limit wait: {c['rate_limit_wait_seconds']:.0f}s"
+            ))
+        self.after(self.LOG_INTERVAL_MS, self._drain_log)
 
     def start_search(self):
         if self.is_running:
@@ -131,16 +177,73 @@ class PixivSorterGUI(ctk.CTk):
         r18 = self.r18_switch.get() == 1
         no_limit = self.no_limit_switch.get() == 1
         auto_download = self.auto_download_switch.get() == 1
+        resume = self.resume_switch.get() == 1
 
         self.is_running = True
+        self.metrics = pixiv_events.Metrics()
         self.run_button.configure(state="disabled", text="Running...")
+        self.batch_button.configure(state="disabled")
         
         # Start in background thread
-        thread = threading.Thread(target=self.run_task, args=(search_term, threshold, pages, r18, delay, start_page, no_limit, auto_download))
+        thread = threading.Thread(target=self.run_task, args=(search_term, threshold, pages, r18, delay, start_page, no_limit, auto_download, resume))
+        thread.daemon = True
+        thread.start()
+
+    def start_batch(self):
+        if self.is_running:
+            return
+
+        path = filedialog.askopenfilename(title="Select batch file (one search term per line)", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if not path:
+            return
+
+        try:
+            threshold = int(self.threshold_entry.get())
+            pages = int(self.pages_entry.get())
+            terms = load_batch_file(path, default_threshold=threshold)
+        except ValueError:
+            self.log("[!] Error: Threshold and Pages must be numbers.")
+            return
+        except OSError as e:
+            self.log(f"[!] Error: Could not read batch file: {e}")
+            return
+
+        delay = self.delay_slider.get()
+        r18 = self.r18_switch.get() == 1
+        no_limit = self.no_limit_switch.get() == 1
+        auto_download = self.auto_download_switch.get() == 1
+        resume = self.resume_switch.get() == 1
+
+        self.is_running = True
+        self.metrics = pixiv_events.Metrics()
+        self.run_button.configure(state="disabled", text="Running...")
+        self.batch_button.configure(state="disabled")
+
+        thread = threading.Thread(target=self.run_batch_task, args=(terms, threshold, pages, r18, delay, no_limit, auto_download, resume))
         thread.daemon = True
         thread.start()
 
-    def run_task(self, search_term, threshold, pages, r18, delay, start_page, no_limit, auto_download):
+    def run_batch_task(self, terms, threshold, pages, r18, delay, no_limit, auto_download, resume):
+        try:
+            run_batch(
+                terms=terms,
+                threshold=threshold,
+                pages=pages,
+                r18=r18,
+                delay=delay,
+                no_limit=no_limit,
+                auto_download=auto_download,
+                resume=resume,
+                logger=self.events
+            )
+        except Exception as e:
+            self.log(f"[!] Critical Error: {e}")
+        finally:
+            self.is_running = False
+            self.after(0, lambda: self.run_button.configure(state="normal", text="Run Search"))
+            self.after(0, lambda: self.batch_button.configure(state="normal"))
+
+    def run_task(self, search_term, threshold, pages, r18, delay, start_page, no_limit, auto_download, resume):
         try:
             run_sorter(
                 search_term=search_term,
@@ -151,13 +254,15 @@ class PixivSorterGUI(ctk.CTk):
                 start_page=start_page,
                 no_limit=no_limit,
                 auto_download=auto_download,
-                logger=self.log
+                resume=resume,
+                logger=self.events
             )
         except Exception as e:
             self.log(f"[!] Critical Error: {e}")
         finally:
             self.is_running = False
             self.after(0, lambda: self.run_button.configure(state="normal", text="Run Search"))
+            self.after(0, lambda: self.batch_button.configure(state="normal"))
 
 if __name__ == "__main__":
     app = PixivSorterGUI()
@@ -0,0 +1,301 @@
+import asyncio
+import os
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    # Without aiohttp, image requests run on asyncio's thread pool instead
+    aiohttp = None
+
+import pixiv_cache
+import pixiv_events
+import pixiv_filter
+import pixiv_http
+import pixiv_sorter
+import pixiv_token
+
+class ImageFetcher:
+    """
+    Image downloads as coroutines on one event loop. With aiohttp installed
+    up to 'max_inflight' requests share one connector ('per_host' per host,
+    default: all of them); otherwise the threaded fetch_to_part() runs
+    through asyncio.to_thread.
+    Partial files are kept as '.part' and resumed with Range requests;
+    originals use pixiv_sorter.part_path() so later runs resume them too.
+    """
+    def __init__(self, max_inflight=64, per_host=None, chunk_size=pixiv_sorter.DOWNLOAD_CHUNK_SIZE, attempts=3, retries=3, backoff=0.5, logger=print):
+        self.max_inflight = max(1, max_inflight)
+        # Originals all come from one host, so a lower cap is the real limit
+        self.per_host = max(1, min(per_host or self.max_inflight, self.max_inflight))
+        self.chunk_size = chunk_size
+        self.attempts = attempts
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logger
+        self.slots = asyncio.Semaphore(self.max_inflight)
+        self.session = None
+        self.succeeded = 0
+        self.reused = 0
+        self.failed = 0
+        self.bytes_written = 0
+
+    async def __aenter__(self):
+        if aiohttp:
+            connector = aiohttp.TCPConnector(limit=self.max_inflight, limit_per_host=self.per_host)
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=15)
+            self.session = aiohttp.ClientSession(headers=pixiv_http.IMAGE_HEADERS, connector=connector, timeout=timeout)
+        else:
+            self.logger("[!] The async engine works best with aiohttp (pip install aiohttp). Image requests run on worker threads instead.")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.session:
+            await self.session.close()
+
+    def summary(self):
+        return {
+            "succeeded": self.succeeded,
+            "reused": self.reused,
+            "failed": self.failed,
+            "bytes": self.bytes_written,
+        }
+
+    async def fetch(self, url, filepath, label="", tmp_path=None):
+        """
+        Downloads 'url' to 'filepath' via 'tmp_path' ('<filepath>.part' by
+        default). Returns the bytes transferred; raises IOError on failure.
+        """
+        tmp_path = tmp_path or f"{filepath}.part"
+        async with self.slots:
+            if self.session:
+                written = await self._fetch_aiohttp(url, tmp_path, label)
+            else:
+                session = pixiv_http.get_session(pool_size=self.per_host)
+                written = await asyncio.to_thread(
+                    pixiv_sorter.fetch_to_part, url, tmp_path, session,
+                    chunk_size=self.chunk_size, attempts=self.attempts, logger=self.logger, label=label
+                )
+        os.replace(tmp_path, filepath)
+        return written
+
+    async def _get(self, url, headers):
+        # The threaded downloads get this from pixiv_http's adapter: 5xx
+        # responses and connection errors are retried with exponential backoff
+        for retry in range(self.retries + 1):
+            try:
+                response = await self.session.get(url, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if retry == self.retries:
+                    raise IOError(str(e))
+            else:
+                if response.status not in pixiv_http.RETRY_STATUSES or retry == self.retries:
+                    return response
+                response.release()
+            await asyncio.sleep(self.backoff * 2 ** retry)
+
+    async def _fetch_aiohttp(self, url, tmp_path, label):
+        # Same resume rules as pixiv_sorter.fetch_to_part()
+        transferred = 0
+        for attempt in range(self.attempts):
+            offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            async with await self._get(url, headers) as response:
+                if response.status == 416:
+                    if pixiv_sorter.content_total(response.status, response.headers, offset) == offset:
+                        return transferred
+                    os.remove(tmp_path)
+                    continue
+                if response.status not in (200, 206):
+                    raise IOError(f"HTTP {response.status}")
+                if response.status == 200:
+                    offset = 0
+                total = pixiv_sorter.content_total(response.status, response.headers, offset)
+                try:
+                    with open(tmp_path, 'ab' if offset else 'wb') as f:
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            f.write(chunk)
+                            transferred += len(chunk)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt + 1 == self.attempts:
+                        raise IOError(str(e))
+                    self.logger(f"  [!] {label} interrupted ({e}), resuming...")
+                    continue
+
+            size = os.path.getsize(tmp_path)
+            if total is None or size == total:
+                return transferred
+            if size > total:
+                os.remove(tmp_path)
+            self.logger(f"  [!] {label} incomplete ({size} of {total} bytes), resuming...")
+        raise IOError(f"incomplete after {self.attempts} attempts")
+
+    async def download_page(self, url, dest_folder, stem, index=None):
+        """
+        Coroutine version of pixiv_sorter.download_page(), counted per file.
+        The index lookups and the SHA-256 of the finished file run on a
+        worker thread so they don't stall the other requests.
+        """
+        filename = f"{stem}{os.path.splitext(url)[1]}"
+        filepath = os.path.join(dest_folder, filename)
+        if index and await asyncio.to_thread(pixiv_sorter.reuse_download, index, filename, filepath):
+            self.reused += 1
+            pixiv_events.emit(self.logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="reused", bytes=0, seconds=0.0)
+            return
+        pixiv_events.emit(self.logger, pixiv_events.DOWNLOAD_STARTED, name=filename, url=url)
+        started = time.monotonic()
+        tmp_path = pixiv_sorter.part_path(filename)
+        # Same part-file lock as pixiv_sorter.download_page(), taken off the loop
+        lock = pixiv_token.file_lock(tmp_path)
+        await asyncio.to_thread(lock.__enter__)
+        try:
+            if index and await asyncio.to_thread(pixiv_sorter.reuse_download, index, filename, filepath):
+                self.reused += 1
+                pixiv_events.emit(self.logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="reused", bytes=0, seconds=time.monotonic() - started)
+                return
+            written = await self.fetch(url, filepath, label=stem, tmp_path=tmp_path)
+            if index:
+                await asyncio.to_thread(pixiv_sorter.record_download, index, filename, filepath, self.chunk_size)
+        except Exception as e:
+            self.failed += 1
+            self.logger(f"  [!] Failed to download {stem}: {e}")
+            pixiv_events.emit(self.logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="failed", bytes=0, seconds=time.monotonic() - started, error=str(e))
+            return
+        finally:
+            lock.__exit__(None, None, None)
+        self.succeeded += 1
+        self.bytes_written += written
+        pixiv_events.emit(self.logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="downloaded", bytes=written, seconds=time.monotonic() - started)
+
+    async def fetch_thumbnail(self, url, thumbs):
+        path = thumbs.path_for(url)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            await self.fetch(url, path, label="thumbnail")
+            thumbs.fetched += 1
+        except Exception as e:
+            thumbs.failed += 1
+            self.logger(f"  [!] Thumbnail failed: {e}")
+
+async def crawl_async(client, search_term, threshold=1000, pages=5, r18=False, start_page=1, no_limit=False, on_hit=None, exporter=None, rules=None, logger=print):
+    """
+    Async counterpart of pixiv_sorter.crawl() with the same stop rules
+    (empty, repeated and circular pages, page limits) and filter. Search
+    requests stay on the rate-limited SearchClient, run via to_thread.
+    Calls on_hit(illust) for every match as soon as its page is filtered.
+    """
+    logger(f"Searching for '{search_term}' starting at page {start_page} with threshold {threshold}...")
+    first_qs = pixiv_sorter.first_search_query(search_term, start_page)
+    try:
+        json_result = await asyncio.to_thread(client.fetch_page, first_qs, logger)
+    except Exception as e:
+        logger(f"API Error fetching first page: {e}")
+        return []
+
+    pager = pixiv_sorter.SearchPager(
+        lambda qs: client.fetch_page(qs, logger=logger), client.api.parse_qs, json_result,
+        start_page=start_page, pages=pages, no_limit=no_limit, logger=logger
+    )
+    page_iter = iter(pager)
+    filtered_illusts = []
+    previous_page_ids = set()
+    while True:
+        # The next page is fetched on a worker thread while downloads keep running
+        item = await asyncio.to_thread(next, page_iter, None)
+        if item is None:
+            break
+        current_page_number, json_result = item
+        illusts = json_result.get('illusts', [])
+
+        current_page_ids = {illust.get('id') for illust in illusts}
+        if pixiv_sorter.is_last_page(illusts, previous_page_ids, current_page_number, logger=logger):
+            break
+        previous_page_ids = current_page_ids
+
+        logger(f"Processing page {current_page_number} ({len(illusts)} items, {client.limiter.current_rate:.2f} req/s)...")
+        for illust in pixiv_filter.filter_page(illusts, threshold, r18, rules):
+            record = pixiv_sorter.IllustRecord.from_illust(illust)
+            filtered_illusts.append(record)
+            pixiv_events.emit(logger, pixiv_events.HIT_FOUND, id=record.id, bookmarks=record.total_bookmarks)
+            if on_hit:
+                on_hit(record)
+            if exporter:
+                exporter.add(illust)
+        if exporter:
+            exporter.flush()
+
+    logger(f"Found {len(filtered_illusts)} images matching the criteria.")
+    return filtered_illusts
+
+async def run_sorter_async(search_term, threshold=1000, pages=5, r18=False, delay=2.5, start_page=1, no_limit=False, auto_download=False, max_inflight=64, per_host=None, skip_existing=True, chunk_size=pixiv_sorter.DOWNLOAD_CHUNK_SIZE, use_cache=False, cache_path=pixiv_cache.DEFAULT_CACHE_PATH, max_rate=1.0, max_retries=5, report="html", local_thumbs=False, api=None, export=None, rules=None, logger=print):
+    """
+    Event-loop version of run_sorter(): pagination, original downloads and
+    thumbnail fetches run as tasks on one loop, with at most 'max_inflight'
+    image requests in flight. Incremental and resumable crawls stay on the
+    threaded engine.
+    """
+    client = pixiv_sorter.SearchClient(delay=delay, max_rate=max_rate, max_retries=max_retries, use_cache=use_cache, cache_path=cache_path, api=api, logger=logger)
+    if not client.cache and not await asyncio.to_thread(client.perform_login):
+        logger("Could not authenticate. Exiting.")
+        return
+
+    pixiv_sorter.copy_stylesheet(logger=logger)
+
+    download_folder = None
+    index = None
+    if auto_download:
+        download_folder = pixiv_sorter.get_unique_download_path(search_term, threshold)
+        index = pixiv_cache.DownloadIndex() if skip_existing else None
+        logger(f"Auto-download enabled ({max_inflight} requests in flight). Images will be saved to: {download_folder}")
+    thumbs = pixiv_cache.ThumbnailCache(logger=logger) if local_thumbs else None
+    exporter = pixiv_sorter.start_exporter(search_term, threshold, export, logger=logger) if export else None
+
+    tasks = []
+    try:
+        async with ImageFetcher(max_inflight=max_inflight, per_host=per_host, chunk_size=chunk_size, logger=logger) as fetcher:
+            seen_thumbs = set()
+            # A work can turn up on two pages; its files are fetched once
+            seen_ids = set()
+
+            def on_hit(illust):
+                illust_id = pixiv_sorter.get_attr(illust, 'id')
+                if download_folder and illust_id not in seen_ids:
+                    seen_ids.add(illust_id)
+                    for stem, url in pixiv_sorter.get_original_pages(illust):
+                        tasks.append(asyncio.create_task(fetcher.download_page(url, download_folder, stem, index=index)))
+                thumb_url = pixiv_sorter.get_thumbnail_url(illust) if thumbs else None
+                if thumb_url and thumb_url not in seen_thumbs:
+                    seen_thumbs.add(thumb_url)
+                    tasks.append(asyncio.create_task(fetcher.fetch_thumbnail(thumb_url, thumbs)))
+
+            try:
+                filtered_illusts = await crawl_async(
+                    client, search_term, threshold=threshold, pages=pages, r18=r18,
+                    start_page=start_page, no_limit=no_limit, on_hit=on_hit, exporter=exporter, rules=rules, logger=logger
+                )
+            finally:
+                client.close()
+                pixiv_sorter.finish_export(exporter, logger=logger)
+                if tasks:
+                    logger("Waiting for downloads to finish...")
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        if download_folder:
+            summary = fetcher.summary()
+            logger(f"Downloads: {summary['succeeded']} succeeded, {summary['reused']} reused, {summary['failed']} failed, {summary['bytes'] / (1024 * 1024):.1f} MB")
+
+        pixiv_sorter.write_report(filtered_illusts, search_term, threshold, report=report, thumbs=thumbs, logger=logger)
+    finally:
+        if index:
+            index.close()
+        if thumbs:
+            thumbs.close()
+
+def run_sorter_blocking(*args, **kwargs):
+    """
+    Runs run_sorter_async() to completion on a new event loop, for the CLI
+    and for the GUI's worker thread.
+    """
+    return asyncio.run(run_sorter_async(*args, **kwargs))
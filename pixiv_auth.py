@@ -2,24 +2,12 @@
 from argparse import ArgumentParser
 from base64 import urlsafe_b64encode
 from hashlib import sha256
-from pprint import pprint
 from secrets import token_urlsafe
 from sys import exit
 from urllib.parse import urlencode, urlparse, parse_qs
-from webbrowser import open as open_url
 
-import requests
 import time
 import json
-try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.chrome.options import Options
-    from webdriver_manager.chrome import ChromeDriverManager
-    from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    SELENIUM_AVAILABLE = False
 
 # Latest app version can be found using GET /v1/application-info/android
 USER_AGENT = "PixivAndroidApp/5.0.234 (Android 11; Pixel 5)"
@@ -52,6 +40,8 @@ def get_auth_token_data(response):
         access_token = data["access_token"]
         refresh_token = data["refresh_token"]
     except KeyError:
+        from pprint import pprint
+
         print("error:")
         pprint(data)
         return None, None
@@ -64,7 +54,13 @@ def get_auth_token_data(response):
 
 def selenium_login(url):
     """Attempt to capture the callback URL automatically using Selenium."""
-    if not SELENIUM_AVAILABLE:
+    # Selenium is slow to import and only needed on this rare path
+    try:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        from webdriver_manager.chrome import ChromeDriverManager
+    except ImportError:
         return None
 
     print("\n[!] Starting automated browser to capture login...")
@@ -193,6 +189,8 @@ def login():
             except (EOFError, KeyboardInterrupt):
                 return
 
+    import requests
+
     response = requests.post(
         AUTH_TOKEN_URL,
         data={
@@ -212,6 +210,8 @@ def login():
 
 
 def refresh(refresh_token):
+    import requests
+
     response = requests.post(
         AUTH_TOKEN_URL,
         data={
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pixiv_http
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "illusts.db")
+
+def _query_key(qs):
+    # parse_qs() returns strings while the first page is built with ints,
+    # so normalise before using the query as a key
+    return json.dumps({k: str(v) for k, v in qs.items() if v not in (None, "")}, sort_keys=True, ensure_ascii=False)
+
+class IllustCache:
+    """
+    On-disk SQLite cache of illust JSON keyed by id, plus the search pages
+    that referenced them. A page is served for 'page_ttl' seconds; its
+    illusts were stored with it, so they are at least as fresh.
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, page_ttl=3600):
+        self.path = path
+        self.page_ttl = page_ttl
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        # One connection shared between threads, serialised by the lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS illusts ("
+                "id INTEGER PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "query TEXT PRIMARY KEY, word TEXT NOT NULL, ids TEXT NOT NULL, next_url TEXT, fetched_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS pages_word ON pages(word)")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def merge(self, illusts, now=None):
+        """
+        Inserts or refreshes illusts fetched from the API.
+        """
+        now = now or time.time()
+        rows = []
+        for illust in illusts:
+            illust_id = illust.get('id')
+            if illust_id is None:
+                continue
+            rows.append((int(illust_id), json.dumps(illust, ensure_ascii=False), now))
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO illusts (id, data, fetched_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data=excluded.data, fetched_at=excluded.fetched_at",
+                rows,
+            )
+
+    def store_page(self, qs, json_result, now=None):
+        """
+        Merges a search_illust response into the cache and remembers the page.
+        """
+        now = now or time.time()
+        illusts = json_result.get('illusts', [])
+        self.merge(illusts, now)
+        ids = [illust.get('id') for illust in illusts]
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (query, word, ids, next_url, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (_query_key(qs), str(qs.get('word', '')), json.dumps(ids), json_result.get('next_url'), now),
+            )
+
+    def get_page(self, qs, now=None):
+        """
+        Returns a cached search page shaped like a search_illust response,
+        or None if the page is stale or one of its illusts is missing.
+        """
+        now = now or time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT ids, next_url, fetched_at FROM pages WHERE query = ?", (_query_key(qs),)
+            ).fetchone()
+            if not row or now - row[2] >= self.page_ttl:
+                return None
+            ids = json.loads(row[0])
+            rows = dict(self.conn.execute(
+                f"SELECT id, data FROM illusts WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            ))
+
+        illusts = []
+        for illust_id in ids:
+            data = rows.get(illust_id)
+            if data is None:
+                return None
+            illusts.append(json.loads(data))
+        return {'illusts': illusts, 'next_url': row[1]}
+
+    def illusts_for_term(self, search_term):
+        """
+        Returns every cached illust that appeared in a search for 'search_term',
+        regardless of age. Used to render reports without touching the API.
+        """
+        with self.lock:
+            ids = []
+            seen = set()
+            for (page_ids,) in self.conn.execute("SELECT ids FROM pages WHERE word = ?", (search_term,)):
+                for illust_id in json.loads(page_ids):
+                    if illust_id not in seen:
+                        seen.add(illust_id)
+                        ids.append(illust_id)
+            illusts = []
+            # Stay below SQLite's bound-parameter limit
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                for (data,) in self.conn.execute(
+                    f"SELECT data FROM illusts WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ):
+                    illusts.append(json.loads(data))
+        return illusts
+
+DEFAULT_THUMB_DIR = os.path.join("cache", "thumbs")
+DEFAULT_INDEX_PATH = os.path.join("download", "index.db")
+
+def link_or_copy(src, dst):
+    """
+    Hardlinks 'src' to 'dst', falling back to a copy where links are not
+    supported (FAT drives, cross-device). The link is made under a temporary
+    name and renamed into place so 'dst' is never half-written.
+    """
+    tmp_path = f"{dst}.link"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        import shutil
+        shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+class DownloadIndex:
+    """
+    Global index of downloaded originals: file name (e.g. '12345.jpg') ->
+    path, size and sha256. Lets later runs reuse files instead of fetching
+    them again, and links byte-identical files together.
+    """
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloads ("
+                "name TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, sha256 TEXT NOT NULL, saved_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS downloads_sha256 ON downloads(sha256)")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def find(self, name):
+        """
+        Returns the path of a previous download of 'name' if it is still on
+        disk with the recorded size, otherwise None.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT path, size FROM downloads WHERE name = ?", (name,)).fetchone()
+        if row and os.path.exists(row[0]) and os.path.getsize(row[0]) == row[1]:
+            return row[0]
+        return None
+
+    def find_by_hash(self, sha256, size):
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM downloads WHERE sha256 = ? AND size = ?", (sha256, size)).fetchall()
+        for (path,) in rows:
+            if os.path.exists(path) and os.path.getsize(path) == size:
+                return path
+        return None
+
+    def add(self, name, path, size, sha256):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO downloads (name, path, size, sha256, saved_at) VALUES (?, ?, ?, ?, ?)",
+                (name, os.path.abspath(path), size, sha256, time.time()),
+            )
+
+class ThumbnailCache:
+    """
+    Content-addressed store of card thumbnails under
+    'cache/thumbs/<sha256(url)[:2]>/<sha256(url)><ext>', shared by every
+    report. Thumbnails are fetched in the background with submit().
+    """
+    def __init__(self, root=DEFAULT_THUMB_DIR, workers=8, session=None, logger=print):
+        self.root = root
+        self.session = session or pixiv_http.get_session(pool_size=workers)
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="thumbs")
+        self.lock = threading.Lock()
+        self.submitted = set()
+        self.futures = []
+        self.fetched = 0
+        self.failed = 0
+
+    def path_for(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        ext = os.path.splitext(url.split("?", 1)[0])[1] or ".jpg"
+        return os.path.join(self.root, digest[:2], f"{digest}{ext}")
+
+    def local_path(self, url):
+        if not url:
+            return None
+        path = self.path_for(url)
+        return path if os.path.exists(path) else None
+
+    def _fetch(self, url):
+        path = self.path_for(url)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.part"
+        try:
+            response = self.session.get(url, timeout=15)
+            if response.status_code != 200:
+                raise IOError(f"HTTP {response.status_code}")
+            with open(tmp_path, "wb") as f:
+                f.write(response.content)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.fetched += 1
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self.lock:
+                self.failed += 1
+            self.logger(f"  [!] Thumbnail failed: {e}")
+
+    def submit(self, url):
+        if not url:
+            return
+        with self.lock:
+            if url in self.submitted:
+                return
+            self.submitted.add(url)
+        if os.path.exists(self.path_for(url)):
+            return
+        future = self.executor.submit(self._fetch, url)
+        with self.lock:
+            self.futures.append(future)
+
+    def wait(self):
+        """
+        Blocks until every thumbnail submitted so far has been fetched or failed.
+        """
+        with self.lock:
+            futures, self.futures = self.futures, []
+        wait(futures)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
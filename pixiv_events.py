@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+
+# Event kinds
+LOG = "log"
+PAGE_FETCHED = "page_fetched"
+HIT_FOUND = "hit_found"
+DOWNLOAD_STARTED = "download_started"
+DOWNLOAD_FINISHED = "download_finished"
+RATE_LIMIT_WAIT = "rate_limit_wait"
+THROTTLED = "throttled"
+
+class Event:
+    __slots__ = ("kind", "time", "data")
+
+    def __init__(self, kind, data, timestamp=None):
+        self.kind = kind
+        self.time = timestamp or time.time()
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data, event=self.kind, time=round(self.time, 3))
+
+class EventBus:
+    """
+    Fans typed events out to subscribers. A bus can be passed anywhere a
+    'logger' callback is expected: bus("text") emits a LOG event, and code
+    that knows about events calls emit(logger, kind, ...) on it.
+    Subscribers run on the emitting thread and should be quick.
+    """
+    def __init__(self, prefix="", tags=None, handlers=None):
+        self.prefix = prefix
+        self.tags = tags or {}
+        self.handlers = handlers if handlers is not None else []
+        self.lock = threading.Lock()
+
+    def subscribe(self, handler):
+        with self.lock:
+            self.handlers.append(handler)
+        return handler
+
+    def emit(self, kind, **data):
+        if self.tags:
+            data = dict(self.tags, **data)
+        event = Event(kind, data)
+        for handler in list(self.handlers):
+            handler(event)
+
+    def __call__(self, message):
+        self.emit(LOG, message=f"{self.prefix}{message}")
+
+    def child(self, prefix="", **tags):
+        """
+        A bus sharing this one's subscribers that prefixes log lines and
+        tags every event, e.g. with the search term of a batch crawl.
+        """
+        return EventBus(self.prefix + prefix, dict(self.tags, **tags), self.handlers)
+
+def emit(logger, kind, **data):
+    """
+    Emits an event if 'logger' is an EventBus; plain print-style loggers
+    only get the text messages, so this is a no-op for them.
+    """
+    if isinstance(logger, EventBus):
+        logger.emit(kind, **data)
+
+def prefixed(logger, prefix, **tags):
+    if isinstance(logger, EventBus):
+        return logger.child(prefix, **tags)
+    return lambda message: logger(f"{prefix}{message}")
+
+def print_logs(event):
+    if event.kind == LOG:
+        print(event.data["message"])
+
+class JsonlExporter:
+    """
+    Writes every event as one JSON line.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8", buffering=64 * 1024)
+
+    def __call__(self, event):
+        line = json.dumps(event.to_dict(), ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class Metrics:
+    """
+    Running counters built from the event stream, readable as a throughput
+    summary or in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {
+            "pages_fetched": 0,
+            "pages_cached": 0,
+            "page_latency_seconds": 0.0,
+            "hits": 0,
+            "downloads_started": 0,
+            "downloads_downloaded": 0,
+            "downloads_reused": 0,
+            "downloads_failed": 0,
+            "download_bytes": 0,
+            "download_seconds": 0.0,
+            "rate_limit_wait_seconds": 0.0,
+            "throttled": 0,
+        }
+
+    def __call__(self, event):
+        data = event.data
+        with self.lock:
+            counters = self.counters
+            if event.kind == PAGE_FETCHED:
+                if data.get("cached"):
+                    counters["pages_cached"] += 1
+                else:
+                    counters["pages_fetched"] += 1
+                    counters["page_latency_seconds"] += data.get("seconds", 0.0)
+            elif event.kind == HIT_FOUND:
+                counters["hits"] += 1
+            elif event.kind == DOWNLOAD_STARTED:
+                counters["downloads_started"] += 1
+            elif event.kind == DOWNLOAD_FINISHED:
+                counters[f"downloads_{data.get('status', 'failed')}"] += 1
+                counters["download_bytes"] += data.get("bytes", 0)
+                counters["download_seconds"] += data.get("seconds", 0.0)
+            elif event.kind == RATE_LIMIT_WAIT:
+                counters["rate_limit_wait_seconds"] += data.get("seconds", 0.0)
+            elif event.kind == THROTTLED:
+                counters["throttled"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters, elapsed_seconds=time.time() - self.started)
+
+    def summary(self):
+        c = self.snapshot()
+        elapsed = max(c["elapsed_seconds"], 1e-9)
+        pages = c["pages_fetched"] + c["pages_cached"]
+        return (
+            f"Throughput: {pages / elapsed:.2f} pages/s, {c['downloads_downloaded'] / elapsed:.2f} images/s, "
+            f"{c['download_bytes'] / (1024 * 1024) / elapsed:.2f} MB/s over {elapsed:.0f}s "
+            f"({c['rate_limit_wait_seconds']:.0f}s waiting on the rate limit)"
+        )
+
+    def prometheus_text(self):
+        c = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP pixiv_{name} {help_text}")
+            lines.append(f"# TYPE pixiv_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"pixiv_{name}{labels} {value}")
+
+        metric("pages_total", "counter", "Search pages processed.", [
+            ('{source="api"}', c["pages_fetched"]),
+            ('{source="cache"}', c["pages_cached"]),
+        ])
+        metric("page_latency_seconds_total", "counter", "Time spent in search API requests.", [("", round(c["page_latency_seconds"], 3))])
+        metric("hits_total", "counter", "Illustrations that matched the filter.", [("", c["hits"])])
+        metric("downloads_started_total", "counter", "Original downloads started.", [("", c["downloads_started"])])
+        metric("downloads_total", "counter", "Original downloads finished, by outcome.", [
+            (f'{{status="{status}"}}', c[f"downloads_{status}"]) for status in ("downloaded", "reused", "failed")
+        ])
+        metric("download_bytes_total", "counter", "Bytes downloaded.", [("", c["download_bytes"])])
+        metric("download_seconds_total", "counter", "Time spent downloading originals.", [("", round(c["download_seconds"], 3))])
+        metric("rate_limit_wait_seconds_total", "counter", "Time spent waiting on the API rate limiter.", [("", round(c["rate_limit_wait_seconds"], 3))])
+        metric("throttled_total", "counter", "Throttled or failed API requests.", [("", c["throttled"])])
+        metric("elapsed_seconds", "gauge", "Seconds since the run started.", [("", round(c["elapsed_seconds"], 3))])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
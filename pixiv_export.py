@@ -0,0 +1,146 @@
+import csv
+import datetime
+import os
+import threading
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # Without pyarrow only the CSV export is available
+    pyarrow = None
+
+EXPORT_FORMATS = ("parquet", "arrow", "csv")
+EXPORT_DIR = "export"
+COLUMNS = ("id", "user_id", "total_bookmarks", "total_view", "create_date", "tags", "x_restrict", "page_count")
+# Parquet row groups and Arrow record batches hold at least this many rows
+ROWS_PER_GROUP = 10000
+
+def export_row(illust):
+    """
+    The export columns of one raw search result (the API's dict).
+    """
+    user = illust.get('user') or {}
+    return (
+        illust.get('id', 0),
+        user.get('id', 0),
+        illust.get('total_bookmarks', 0),
+        illust.get('total_view', 0),
+        illust.get('create_date', ''),
+        [tag.get('name', '') for tag in illust.get('tags') or []],
+        illust.get('x_restrict', 0),
+        illust.get('page_count', 1),
+    )
+
+def export_path(search_term, threshold, export_format):
+    safe_term = "".join([c for c in search_term if c.isalnum() or c in (' ', '_', '-')]).strip()
+    return os.path.join(EXPORT_DIR, f"{safe_term} {threshold}.{export_format}")
+
+def _arrow_schema():
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("user_id", pyarrow.int64()),
+        ("total_bookmarks", pyarrow.int64()),
+        ("total_view", pyarrow.int64()),
+        ("create_date", pyarrow.timestamp("s", tz="UTC")),
+        ("tags", pyarrow.list_(pyarrow.string())),
+        ("x_restrict", pyarrow.int8()),
+        ("page_count", pyarrow.int32()),
+    ])
+
+def _parse_date(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+class RowBuffer:
+    """
+    Collects export rows without writing them, e.g. in a worker process
+    that hands its rows to the parent's ColumnarExporter.
+    """
+    def __init__(self):
+        self.rows = []
+
+    def add(self, illust):
+        self.rows.append(export_row(illust))
+
+    def flush(self):
+        pass
+
+class ColumnarExporter:
+    """
+    Writes matching illustrations to a columnar file while the crawl runs:
+    Parquet row groups or Arrow IPC record batches when pyarrow is
+    installed, CSV otherwise (tags space-separated, as Pixiv tags have no
+    spaces). The crawl calls add() per hit and flush() per page; the file
+    is written as '<path>.part' and moved into place by close().
+    """
+    def __init__(self, path, export_format="parquet", rows_per_group=ROWS_PER_GROUP, logger=print):
+        if export_format != "csv" and pyarrow is None:
+            logger(f"[!] {export_format} export needs pyarrow (pip install pyarrow). Writing CSV instead.")
+            export_format = "csv"
+            path = f"{os.path.splitext(path)[0]}.csv"
+        self.path = path
+        self.format = export_format
+        self.rows_per_group = rows_per_group if export_format != "csv" else 1
+        self.tmp_path = f"{path}.part"
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.rows = []
+        self.count = 0
+        self.writer = None
+        self.file = None
+        self.schema = _arrow_schema() if export_format != "csv" else None
+        if export_format == "csv":
+            self.file = open(self.tmp_path, "w", encoding="utf-8", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(COLUMNS)
+        elif export_format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(self.tmp_path, self.schema, compression="zstd")
+        else:
+            self.file = pyarrow.OSFile(self.tmp_path, "wb")
+            self.writer = pyarrow.ipc.new_file(self.file, self.schema)
+
+    def add(self, illust):
+        row = export_row(illust)
+        with self.lock:
+            self.rows.append(row)
+
+    def add_rows(self, rows):
+        with self.lock:
+            self.rows.extend(rows)
+
+    def flush(self, force=False):
+        with self.lock:
+            if not self.rows or (len(self.rows) < self.rows_per_group and not force):
+                return
+            rows, self.rows = self.rows, []
+            self.count += len(rows)
+            if self.format == "csv":
+                self.writer.writerows(row[:5] + (" ".join(row[5]),) + row[6:] for row in rows)
+                self.file.flush()
+                return
+            columns = [list(column) for column in zip(*rows)]
+            columns[4] = [_parse_date(value) for value in columns[4]]
+            batch = pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+                schema=self.schema,
+            )
+            self.writer.write_batch(batch)
+
+    def close(self):
+        """
+        Writes what is left, closes the file and returns its final path.
+        """
+        self.flush(force=True)
+        with self.lock:
+            if self.format != "csv":
+                self.writer.close()
+            if self.file:
+                self.file.close()
+            os.replace(self.tmp_path, self.path)
+        return self.path
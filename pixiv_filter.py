@@ -0,0 +1,143 @@
+import datetime
+import time
+
+# Below this many rows NumPy's per-call overhead outweighs the vector ops
+# (a live search page has 30), so short batches stay in plain Python
+VECTOR_MIN_ROWS = 256
+
+# Pixiv's create_date is JST (+09:00)
+JST_OFFSET = 9 * 3600
+
+_numpy = False
+
+def _load_numpy():
+    # Imported on first large batch; None without NumPy, where the same
+    # rules run as list comprehensions
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+class FilterRules:
+    """
+    Filters on top of the likes threshold and R-18 switch:
+    - include_tags: every one of these tags must be present
+    - exclude_tags: none of these tags may be present
+    - since / until: 'YYYY-MM-DD' bounds on the post date (Pixiv's JST date)
+    - min_per_day: likes per day since posting; a work this fast passes
+      even below the threshold, for recent works that are climbing fast
+      but not yet over its absolute count
+    Tag rules need the raw search JSON; IllustRecords carry no tags.
+    """
+    def __init__(self, include_tags=(), exclude_tags=(), since=None, until=None, min_per_day=0.0):
+        self.include_tags = frozenset(include_tags or ())
+        self.exclude_tags = frozenset(exclude_tags or ())
+        self.since = since
+        self.until = until
+        self.min_per_day = min_per_day or 0.0
+
+    def __bool__(self):
+        return bool(self.include_tags or self.exclude_tags or self.since or self.until or self.min_per_day)
+
+    def without_tags(self):
+        """
+        The date and likes-per-day rules alone, for IllustRecords.
+        """
+        return FilterRules(since=self.since, until=self.until, min_per_day=self.min_per_day)
+
+def _column(items, key, default):
+    # Pages are homogeneous: raw JSON dicts or IllustRecords, checked once
+    if items and isinstance(items[0], dict):
+        return [item.get(key, default) for item in items]
+    return [getattr(item, key, default) for item in items]
+
+def _per_day(count, date, now):
+    # Likes per day since posting; 0.0 for a missing or unparseable date
+    try:
+        posted = datetime.datetime.fromisoformat(date).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+    return count / max((now - posted) / 86400, 1.0)
+
+def _tags_ok(illust, rules):
+    names = {tag.get('name') for tag in illust.get('tags') or ()} if isinstance(illust, dict) else set()
+    return rules.include_tags <= names and not (rules.exclude_tags & names)
+
+def filter_mask(items, threshold, r18, rules=None, now=None):
+    """
+    Evaluates the filter for a whole page at once and returns one bool per
+    item: (threshold or likes-per-day) and R-18, date and tag rules.
+    Columns are pulled out once per page, then everything but the tags runs
+    as NumPy masks on large batches (list comprehensions otherwise); tag
+    rules run only on rows that are still in.
+    """
+    if not items:
+        return []
+    numpy = _load_numpy() if len(items) >= VECTOR_MIN_ROWS else None
+    bookmarks = _column(items, 'total_bookmarks', 0)
+    x_restrict = _column(items, 'x_restrict', 0) if not r18 else None
+    dates = _column(items, 'create_date', '') if rules and (rules.since or rules.until or rules.min_per_day) else None
+
+    if numpy is not None:
+        bookmarks = numpy.asarray(bookmarks, dtype=numpy.int64)
+        mask = bookmarks >= threshold
+        if dates is not None:
+            # Parsed in C as JST wall-clock times; blank dates become NaT,
+            # which compares False but has to be masked out of the arithmetic
+            posted = numpy.array([date[:19] for date in dates], dtype="datetime64[s]")
+            dated = ~numpy.isnat(posted)
+            if rules.min_per_day:
+                now_jst = numpy.datetime64(int((now or time.time()) + JST_OFFSET), "s")
+                age_days = numpy.maximum((now_jst - posted).astype(numpy.float64) / 86400, 1.0)
+                mask |= dated & (bookmarks / age_days >= rules.min_per_day)
+            if rules.since:
+                mask &= posted >= numpy.datetime64(rules.since)
+            if rules.until:
+                mask &= posted < numpy.datetime64(rules.until) + numpy.timedelta64(1, "D")
+        if x_restrict is not None:
+            mask &= numpy.asarray(x_restrict, dtype=numpy.int64) == 0
+        mask = mask.tolist()
+    else:
+        mask = [count >= threshold for count in bookmarks]
+        if dates is not None:
+            if rules.min_per_day:
+                current = now or time.time()
+                mask = [
+                    keep or _per_day(count, date, current) >= rules.min_per_day
+                    for keep, count, date in zip(mask, bookmarks, dates)
+                ]
+            # Undated works fail both, as NaT does on the NumPy path
+            if rules.since:
+                mask = [keep and bool(date) and date[:10] >= rules.since for keep, date in zip(mask, dates)]
+            if rules.until:
+                mask = [keep and bool(date) and date[:10] <= rules.until for keep, date in zip(mask, dates)]
+        if x_restrict is not None:
+            mask = [keep and restrict == 0 for keep, restrict in zip(mask, x_restrict)]
+
+    if rules and (rules.include_tags or rules.exclude_tags):
+        mask = [keep and _tags_ok(item, rules) for keep, item in zip(mask, items)]
+    return mask
+
+def filter_page(items, threshold, r18, rules=None, now=None):
+    """
+    The items that pass filter_mask(), in page order.
+    """
+    return [item for item, keep in zip(items, filter_mask(items, threshold, r18, rules, now)) if keep]
+
+def rank(items, key='total_bookmarks'):
+    """
+    Sorts 'items' by 'key' descending through a precomputed key array.
+    Stable, like list.sort(reverse=True): ties keep their current order.
+    """
+    keys = _column(items, key, 0)
+    numpy = _load_numpy() if len(items) >= VECTOR_MIN_ROWS else None
+    if numpy is not None:
+        order = numpy.argsort(-numpy.asarray(keys, dtype=numpy.int64), kind="stable").tolist()
+    else:
+        order = sorted(range(len(items)), key=keys.__getitem__, reverse=True)
+    items[:] = [items[index] for index in order]
+    return items
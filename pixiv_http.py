@@ -0,0 +1,140 @@
+import threading
+import time
+
+# requests and urllib3 are imported on first use: they are most of the
+# import time of the CLI and GUI, and nothing needs them before a request
+
+# Headers the image hosts (i.pximg.net) expect, set once on the session
+IMAGE_HEADERS = {
+    "Referer": "https://www.pixiv.net/",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+DEFAULT_POOL_SIZE = 10
+# Responses retried with backoff rather than failed outright
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_shared_session = None
+_shared_pool_size = 0
+_session_lock = threading.Lock()
+
+def _make_adapter(pool_size, retries, backoff):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, retries=3, backoff=0.5):
+    """
+    Creates a keep-alive session with a connection pool of 'pool_size' per host.
+    5xx responses and connection resets are retried with exponential backoff.
+    """
+    import requests
+
+    session = requests.Session()
+    session.headers.update(IMAGE_HEADERS)
+    adapter = _make_adapter(pool_size, retries, backoff)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session(pool_size=None, retries=3, backoff=0.5):
+    """
+    Returns the process-wide image session, creating it on first use.
+    If a larger pool is requested later, the pool is grown in place.
+    """
+    global _shared_session, _shared_pool_size
+    pool_size = pool_size or DEFAULT_POOL_SIZE
+    with _session_lock:
+        if _shared_session is None:
+            _shared_session = create_session(pool_size, retries, backoff)
+            _shared_pool_size = pool_size
+        elif pool_size > _shared_pool_size:
+            adapter = _make_adapter(pool_size, retries, backoff)
+            _shared_session.mount("https://", adapter)
+            _shared_session.mount("http://", adapter)
+            _shared_pool_size = pool_size
+        return _shared_session
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket for API requests whose refill rate follows AIMD: it grows
+    additively toward 'max_rate' while requests succeed and is cut
+    multiplicatively on throttling, with an exponential backoff pause.
+    Rates are in requests per second.
+    """
+    def __init__(self, rate=0.4, max_rate=1.0, min_rate=0.05, increase=0.05, decrease=0.5, burst=1, base_backoff=2.0, max_backoff=300.0):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = min(max(rate, self.min_rate), max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.backoff_until = 0.0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @property
+    def current_rate(self):
+        return self.rate
+
+    def _refill(self, now):
+        # No credit builds up while backing off
+        elapsed = now - max(self.updated, self.backoff_until)
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent. Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.backoff_until:
+                    wait = self.backoff_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self, retry_after=None):
+        """
+        Backs off after a throttling response or failed request.
+        Returns the pause in seconds before the next request is allowed.
+        """
+        with self.lock:
+            self.failures += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            pause = min(self.max_backoff, self.base_backoff * 2 ** (self.failures - 1))
+            if retry_after:
+                pause = max(pause, retry_after)
+            self.backoff_until = time.monotonic() + pause
+            # Start from an empty bucket once the pause is over
+            self.tokens = 0
+            return pause
@@ -0,0 +1,84 @@
+import datetime
+
+STRATEGIES = ("auto", "scan", "popular", "users_tag")
+
+# Community popularity tags ('1000users入り') that exist on Pixiv
+POPULAR_TAG_BUCKETS = (50, 100, 300, 500, 1000, 3000, 5000, 10000, 20000, 30000, 50000, 100000)
+
+def popular_tag_word(search_term, threshold):
+    """
+    Returns '<search term> <N>users入り' for the largest bucket N not above
+    'threshold', or None if the threshold is below every bucket.
+    """
+    buckets = [bucket for bucket in POPULAR_TAG_BUCKETS if bucket <= threshold]
+    if not buckets:
+        return None
+    return f"{search_term} {buckets[-1]}users入り"
+
+def parse_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+def iso_date(value):
+    """
+    argparse type for --since/--until: normalises '2024-1-5' to '2024-01-05',
+    the form the filters compare against.
+    """
+    return parse_date(value).isoformat()
+
+def date_windows(start, end=None, days=30):
+    """
+    Splits [start, end] into consecutive windows of 'days' days, newest
+    first, as ('YYYY-MM-DD', 'YYYY-MM-DD') pairs for search_illust's
+    start_date/end_date. Each window is its own next_url chain, so a tag
+    too big for one chain's offset ceiling is still crawled in full.
+    """
+    start = parse_date(start)
+    end = parse_date(end) if end else datetime.date.today()
+    days = max(1, days or (end - start).days + 1)
+    windows = []
+    window_end = end
+    while window_end >= start:
+        window_start = max(start, window_end - datetime.timedelta(days=days - 1))
+        windows.append((window_start.isoformat(), window_end.isoformat()))
+        window_end = window_start - datetime.timedelta(days=1)
+    return windows
+
+def resolve_strategy(strategy, is_premium, threshold, logger=print):
+    """
+    Picks the query shape for a crawl. 'auto' uses popular_desc on premium
+    accounts and the plain date_desc scan otherwise.
+    """
+    if strategy == "auto":
+        return "popular" if is_premium else "scan"
+    if strategy == "popular" and not is_premium:
+        logger("[!] popular_desc search needs a premium account. Falling back to the date scan.")
+        return "scan"
+    if strategy == "users_tag" and not popular_tag_word("", threshold):
+        logger(f"[!] No users入り tag at or below {threshold} likes. Falling back to the date scan.")
+        return "scan"
+    return strategy
+
+def build_queries(search_term, threshold, strategy, since=None, until=None, window_days=None):
+    """
+    Returns the first-page search_illust parameters for a resolved
+    strategy, one per date window (a single query without a date range).
+    """
+    query = {
+        "word": search_term,
+        "search_target": "partial_match_for_tags",
+        "sort": "date_desc",
+        "filter": "for_ios",
+        "offset": 0,
+    }
+    if strategy == "popular":
+        query["sort"] = "popular_desc"
+    elif strategy == "users_tag":
+        query["word"] = popular_tag_word(search_term, threshold)
+
+    if not since:
+        if until:
+            query["end_date"] = parse_date(until).isoformat()
+        return [query]
+    return [dict(query, start_date=start_date, end_date=end_date) for start_date, end_date in date_windows(since, until, window_days)]
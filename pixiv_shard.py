@@ -0,0 +1,137 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pixiv_cache
+import pixiv_events
+import pixiv_search
+import pixiv_sorter
+
+# Used as --since when a sharded crawl has no date range: Pixiv's launch
+PIXIV_LAUNCH_DATE = "2007-09-10"
+DEFAULT_WINDOW_DAYS = 30
+
+def crawl_shard(search_term, window, threshold, pages, r18, no_limit, delay, max_rate, max_retries, use_cache, cache_path, prefetch_pages, strategy, export, rules, event_queue):
+    """
+    Worker process: crawls one (start_date, end_date) window with its own
+    SearchClient and session, and returns the hits as dicts with their
+    export rows (see pixiv_export). 'strategy' is already resolved. Log
+    lines and events go back to the parent through 'event_queue'.
+    """
+    start_date, end_date = window
+    bus = pixiv_events.EventBus(prefix=f"[{start_date} to {end_date}] ")
+    bus.subscribe(lambda event: event_queue.put((event.kind, event.data)))
+
+    client = pixiv_sorter.SearchClient(delay=delay, max_rate=max_rate, max_retries=max_retries, use_cache=use_cache, cache_path=cache_path, logger=bus)
+    rows = None
+    if export:
+        import pixiv_export
+        rows = pixiv_export.RowBuffer()
+    try:
+        queries = pixiv_search.build_queries(search_term, threshold, strategy, since=start_date, until=end_date)
+        hits = pixiv_sorter.crawl_queries(
+            client, queries, threshold=threshold, pages=pages, r18=r18, no_limit=no_limit,
+            prefetch_pages=prefetch_pages, stop_below_threshold=(strategy == "popular"),
+            exporter=rows, rules=rules, logger=bus
+        )
+    finally:
+        client.close()
+    return [hit.to_dict() for hit in hits], rows.rows if rows else []
+
+def _forward_events(event_queue, logger):
+    # Re-emits worker events on the parent's logger until the None sentinel
+    while True:
+        item = event_queue.get()
+        if item is None:
+            return
+        kind, data = item
+        if kind == pixiv_events.LOG:
+            logger(data["message"])
+        else:
+            pixiv_events.emit(logger, kind, **data)
+
+def run_sharded(search_term, threshold=1000, pages=5, r18=False, delay=2.5, no_limit=False, shards=4, since=None, until=None, window_days=None, auto_download=False, download_workers=4, per_host=None, pool_size=None, use_cache=False, cache_path=pixiv_cache.DEFAULT_CACHE_PATH, max_rate=1.0, max_retries=5, prefetch_pages=1, report="html", skip_existing=True, local_thumbs=False, chunk_size=pixiv_sorter.DOWNLOAD_CHUNK_SIZE, strategy="auto", export=None, rules=None, logger=print):
+    """
+    Splits one tag's history into disjoint date windows and crawls them in a
+    pool of 'shards' processes. Every window is its own next_url chain, so
+    deep history is reachable past the per-chain offset ceiling, and 'pages'
+    applies per window. The API rate budget ('delay', 'max_rate') is divided
+    evenly between the workers. Hits are merged and deduplicated by id;
+    downloads and the export run in this process as each window finishes.
+    """
+    shards = max(1, shards)
+    windows = pixiv_search.date_windows(since or PIXIV_LAUNCH_DATE, until, window_days or DEFAULT_WINDOW_DAYS)
+    if not windows:
+        logger(f"[!] Nothing to crawl: {since or PIXIV_LAUNCH_DATE} is after {until or 'today'}.")
+        return
+
+    # Log in here first: any interactive login happens in this process, and
+    # the workers then start from the shared access-token cache
+    client = pixiv_sorter.SearchClient(delay=delay, max_rate=max_rate, max_retries=max_retries, logger=logger)
+    try:
+        if not client.perform_login():
+            logger("Could not authenticate. Exiting.")
+            return
+        strategy = pixiv_search.resolve_strategy(strategy, client.is_premium, threshold, logger=logger)
+    finally:
+        client.close()
+
+    logger(f"Sharded crawl of '{search_term}': {len(windows)} windows from {windows[-1][0]} to {windows[0][1]} on {shards} processes.")
+
+    pixiv_sorter.copy_stylesheet(logger=logger)
+    download_pool = None
+    if auto_download:
+        download_pool = pixiv_sorter.start_download_pool(search_term, threshold, download_workers, per_host, pool_size, skip_existing=skip_existing, chunk_size=chunk_size, logger=logger)
+    thumbs = pixiv_cache.ThumbnailCache(logger=logger) if local_thumbs else None
+    exporter = pixiv_sorter.start_exporter(search_term, threshold, export, logger=logger) if export else None
+
+    manager = multiprocessing.Manager()
+    event_queue = manager.Queue()
+    forwarder = threading.Thread(target=_forward_events, args=(event_queue, logger), daemon=True)
+    forwarder.start()
+
+    hits = {}
+    try:
+        try:
+            with ProcessPoolExecutor(max_workers=shards) as executor:
+                futures = {
+                    executor.submit(
+                        crawl_shard, search_term, window, threshold, pages, r18, no_limit,
+                        delay * shards, max_rate / shards, max_retries, use_cache, cache_path,
+                        prefetch_pages, strategy, export, rules, event_queue
+                    ): window
+                    for window in windows
+                }
+                for future in as_completed(futures):
+                    start_date, end_date = futures[future]
+                    try:
+                        shard_hits, shard_rows = future.result()
+                    except Exception as e:
+                        logger(f"[!] Window {start_date} to {end_date} failed: {e}")
+                        continue
+                    new_ids = set()
+                    for data in shard_hits:
+                        record = pixiv_sorter.IllustRecord.from_dict(data)
+                        if record.id in hits:
+                            continue
+                        hits[record.id] = record
+                        new_ids.add(record.id)
+                        if download_pool:
+                            download_pool.submit(record)
+                        if thumbs:
+                            thumbs.submit(record.thumb_url)
+                    if exporter:
+                        exporter.add_rows([row for row in shard_rows if row[0] in new_ids])
+                        exporter.flush()
+        finally:
+            event_queue.put(None)
+            forwarder.join()
+            manager.shutdown()
+            pixiv_sorter.finish_downloads(download_pool, logger=logger)
+            pixiv_sorter.finish_export(exporter, logger=logger)
+
+        logger(f"Merged {len(hits)} unique images from {len(windows)} windows.")
+        pixiv_sorter.write_report(list(hits.values()), search_term, threshold, report=report, thumbs=thumbs, logger=logger)
+    finally:
+        if thumbs:
+            thumbs.close()
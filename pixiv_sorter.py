@@ -1,11 +1,23 @@
-import requests
 import argparse
-import webbrowser
-from pixivpy3 import AppPixivAPI
-import time
 import sys
 import os
+import json
+import time
+import hashlib
+import itertools
+import collections
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import pixiv_auth
+import pixiv_http
+import pixiv_cache
+import pixiv_state
+import pixiv_events
+import pixiv_filter
+import pixiv_search
+import pixiv_token
 
 def get_unique_download_path(search_term, threshold):
     """
@@ -31,82 +43,409 @@ def get_unique_download_path(search_term, threshold):
     os.makedirs(dest_path)
     return dest_path
 
-def download_image(illust, dest_folder, logger=print):
+def get_attr(obj, key, default=None):
+    """
+    Reads 'key' from a JSON dict or a pixivpy object alike.
+    """
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+def resolve_image_urls(illust):
     """
-    Downloads the high-resolution (original) version of an illustration.
+    The one place the image URL fallbacks live. Returns
+    (thumb_url, preview_url, original_urls) with one original per page:
+    every meta_pages original for multi-page works, otherwise
+    meta_single_page -> meta_pages[0] -> image_urls.large.
     """
-    if isinstance(illust, dict):
-        # Extract original URL
-        meta_single = illust.get('meta_single_page', {})
-        url = meta_single.get('original_image_url')
-        if not url:
-            meta_pages = illust.get('meta_pages', [])
-            if meta_pages:
-                url = meta_pages[0].get('image_urls', {}).get('original')
-        
+    image_urls = get_attr(illust, 'image_urls')
+    thumb_url = get_attr(image_urls, 'square_medium') if image_urls else None
+    # Use "large" (master) for the preview/lightbox (not the original P0)
+    preview_url = (get_attr(image_urls, 'large') or get_attr(image_urls, 'medium')) if image_urls else None
+
+    meta_pages = get_attr(illust, 'meta_pages') or []
+    originals = [get_attr(get_attr(page, 'image_urls'), 'original') for page in meta_pages]
+    originals = [url for url in originals if url]
+    if len(originals) <= 1:
+        url = get_attr(get_attr(illust, 'meta_single_page'), 'original_image_url')
+        if not url and originals:
+            url = originals[0]
         # Fallback to large if original not found
-        if not url:
-            url = illust.get('image_urls', {}).get('large')
-            
-        illust_id = illust.get('id')
-        title = illust.get('title', 'Untitled')
-    else:
-        # For object-based results (less common with json_result)
-        meta_single = getattr(illust, 'meta_single_page', {})
-        url = getattr(meta_single, 'original_image_url', None)
-        if not url:
-            meta_pages = getattr(illust, 'meta_pages', [])
-            if meta_pages:
-                url = meta_pages[0].get('image_urls', {}).get('original')
-        
-        if not url:
-            image_urls = getattr(illust, 'image_urls', {})
-            url = getattr(image_urls, 'large', None)
-
-        illust_id = getattr(illust, 'id', '0')
-        title = getattr(illust, 'title', 'Untitled')
-
-    if not url:
+        if not url and image_urls:
+            url = get_attr(image_urls, 'large')
+        originals = [url] if url else []
+    return thumb_url, preview_url, originals
+
+def get_thumbnail_url(illust):
+    """
+    Returns the square_medium URL the report cards show.
+    """
+    return IllustRecord.from_illust(illust).thumb_url
+
+def get_original_pages(illust):
+    """
+    Returns [(filename_stem, url), ...] for every page of an illustration.
+    Single-page works keep the plain '<id>' name; manga pages get '<id>_p<n>'.
+    """
+    return IllustRecord.from_illust(illust).pages()
+
+def proxy_url(url):
+    if url:
+        return url.replace("i.pximg.net", "i.pixiv.re")
+    return "https://via.placeholder.com/300?text=No+Image"
+
+class IllustRecord:
+    """
+    The parts of a search hit that the report and downloader use, resolved
+    once at filter time. Holding these instead of the raw search JSON (tags,
+    caption, nested user, every URL size) keeps long crawls small.
+    Attribute names match the raw JSON keys so pixiv_filter and the
+    report's sort work on either. The URL helpers above accept raw hits too
+    but resolve them again on every call; records resolve once.
+    """
+    __slots__ = ("id", "title", "user_name", "total_bookmarks", "create_date", "x_restrict", "page_count", "thumb_url", "preview_url", "original_urls")
+
+    def __init__(self, id, title="Untitled", user_name="Unknown", total_bookmarks=0, create_date="", x_restrict=0, page_count=1, thumb_url=None, preview_url=None, original_urls=()):
+        self.id = id
+        self.title = title
+        self.user_name = user_name
+        self.total_bookmarks = total_bookmarks
+        self.create_date = create_date
+        self.x_restrict = x_restrict
+        self.page_count = page_count
+        self.thumb_url = thumb_url
+        self.preview_url = preview_url
+        self.original_urls = tuple(original_urls)
+
+    @classmethod
+    def from_illust(cls, illust):
+        """
+        Builds a record from a search_illust entry (dict or pixivpy object).
+        """
+        if isinstance(illust, cls):
+            return illust
+
+        thumb_url, preview_url, original_urls = resolve_image_urls(illust)
+        user = get_attr(illust, 'user')
+        return cls(
+            id=get_attr(illust, 'id'),
+            title=get_attr(illust, 'title', 'Untitled'),
+            user_name=get_attr(user, 'name', 'Unknown') if user else 'Unknown',
+            total_bookmarks=get_attr(illust, 'total_bookmarks', 0),
+            create_date=get_attr(illust, 'create_date', ''),
+            x_restrict=get_attr(illust, 'x_restrict', 0),
+            page_count=get_attr(illust, 'page_count') or len(original_urls) or 1,
+            thumb_url=thumb_url,
+            preview_url=preview_url,
+            original_urls=original_urls,
+        )
+
+    @property
+    def original_url(self):
+        return self.original_urls[0] if self.original_urls else self.preview_url
+
+    def pages(self):
+        if len(self.original_urls) > 1:
+            return [(f"{self.id}_p{n}", url) for n, url in enumerate(self.original_urls)]
+        url = self.original_url
+        return [(f"{self.id}", url)] if url else []
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Inverse of to_dict().
+        """
+        return cls(**data)
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Partial downloads live here rather than in the per-run folder, so a
+# later run (which gets a fresh '(n)' folder) still finds and resumes them
+PARTS_DIR = os.path.join("download", ".parts")
+
+def part_path(filename):
+    """
+    Where the partial download of 'filename' is kept between runs.
+    """
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    return os.path.join(PARTS_DIR, f"{filename}.part")
+
+def content_total(status, headers, offset):
+    """
+    Full size of the file being fetched, from Content-Range on a 206 or
+    Content-Length on a 200. None if the server didn't say.
+    """
+    content_range = headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    length = headers.get("Content-Length")
+    if length is None:
+        return None
+    return int(length) + (offset if status == 206 else 0)
+
+def fetch_to_part(url, tmp_path, session, chunk_size=DOWNLOAD_CHUNK_SIZE, attempts=3, logger=print, label=""):
+    """
+    Downloads 'url' into 'tmp_path', resuming from whatever is already there
+    with a Range request. A dropped connection is resumed up to 'attempts'
+    times. Returns the bytes transferred once the file matches the server's
+    size; raises IOError otherwise, leaving the partial file for next time.
+    """
+    import requests
+
+    transferred = 0
+    for attempt in range(attempts):
+        offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        # Connection failures are retried by the session's adapter
+        with session.get(url, stream=True, timeout=15, headers=headers) as response:
+            if response.status_code == 416:
+                # Nothing left to fetch, or the part is bigger than the file
+                if content_total(response.status_code, response.headers, offset) == offset:
+                    return transferred
+                os.remove(tmp_path)
+                continue
+            if response.status_code not in (200, 206):
+                raise IOError(f"HTTP {response.status_code}")
+            if response.status_code == 200:
+                # Range ignored: start over
+                offset = 0
+            total = content_total(response.status_code, response.headers, offset)
+            try:
+                with open(tmp_path, 'ab' if offset else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        transferred += len(chunk)
+            except requests.RequestException as e:
+                if attempt + 1 == attempts:
+                    raise
+                logger(f"  [!] {label} interrupted ({e}), resuming...")
+                continue
+
+        size = os.path.getsize(tmp_path)
+        if total is None or size == total:
+            return transferred
+        if size > total:
+            os.remove(tmp_path)
+        logger(f"  [!] {label} incomplete ({size} of {total} bytes), resuming...")
+    raise IOError(f"incomplete after {attempts} attempts")
+
+def _file_sha256(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def reuse_download(index, filename, filepath):
+    """
+    Links an earlier download of 'filename' to 'filepath'. Returns True if
+    the index had one still on disk.
+    """
+    existing = index.find(filename) if index else None
+    if not existing:
         return False
+    if os.path.abspath(existing) != os.path.abspath(filepath):
+        pixiv_cache.link_or_copy(existing, filepath)
+    return True
 
+def record_download(index, filename, filepath, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    if not index:
+        return
+    # Hash the finished file; a resumed download never saw its first bytes
+    size = os.path.getsize(filepath)
+    sha256 = _file_sha256(filepath, chunk_size)
+    # Byte-identical file under another name: share its disk space
+    duplicate = index.find_by_hash(sha256, size)
+    if duplicate and os.path.abspath(duplicate) != os.path.abspath(filepath):
+        pixiv_cache.link_or_copy(duplicate, filepath)
+    index.add(filename, filepath, size, sha256)
+
+def download_page(url, dest_folder, stem, logger=print, session=None, index=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Downloads one original page to '<dest_folder>/<stem><ext>'.
+    Uses the shared keep-alive session unless one is passed in. With a
+    DownloadIndex, a file already fetched by an earlier run or another tag
+    is linked into 'dest_folder' instead of being downloaded again.
+    Bytes arrive in 'download/.parts/<file>.part', which is resumed after an
+    error or on a later run (whatever its folder) and only moved into place
+    once its size matches Content-Length. The part file is locked while in
+    use, so parallel runs never write it at once.
+    Returns (status, bytes) where status is 'downloaded', 'reused' or 'failed'.
+    """
     # Get file extension from URL
     ext = os.path.splitext(url)[1]
-    filename = f"{illust_id}{ext}"
+    filename = f"{stem}{ext}"
     filepath = os.path.join(dest_folder, filename)
 
-    headers = {
-        "Referer": "https://www.pixiv.net/",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
+    if reuse_download(index, filename, filepath):
+        pixiv_events.emit(logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="reused", bytes=0, seconds=0.0)
+        return "reused", 0
 
-    try:
-        response = requests.get(url, headers=headers, stream=True, timeout=15)
-        if response.status_code == 200:
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return True
-        else:
-            logger(f"  [!] Failed to download {illust_id}: HTTP {response.status_code}")
-    except Exception as e:
-        logger(f"  [!] Error downloading {illust_id}: {e}")
-    
-    return False
+    if session is None:
+        session = pixiv_http.get_session()
 
-def generate_html(illustrations, search_term, threshold, filename="output.html"):
-    # Create results directory if it doesn't exist
-    output_dir = "results"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    filepath = os.path.join(output_dir, filename)
+    pixiv_events.emit(logger, pixiv_events.DOWNLOAD_STARTED, name=filename, url=url)
+    started = time.monotonic()
+    tmp_path = part_path(filename)
+    # Concurrent runs share the part file: one fetches, the others wait
+    with pixiv_token.file_lock(tmp_path):
+        if reuse_download(index, filename, filepath):
+            # Fetched by another run while we waited
+            pixiv_events.emit(logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="reused", bytes=0, seconds=time.monotonic() - started)
+            return "reused", 0
+        try:
+            written = fetch_to_part(url, tmp_path, session, chunk_size=chunk_size, logger=logger, label=stem)
+            os.replace(tmp_path, filepath)
+        except Exception as e:
+            logger(f"  [!] Failed to download {stem}: {e}")
+            pixiv_events.emit(logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="failed", bytes=0, seconds=time.monotonic() - started, error=str(e))
+            return "failed", 0
+        record_download(index, filename, filepath, chunk_size)
 
-    # Sort by likes descending by default for the initial render
-    illustrations.sort(key=lambda x: (x.get('total_bookmarks', 0) if isinstance(x, dict) else getattr(x, 'total_bookmarks', 0)), reverse=True)
+    pixiv_events.emit(logger, pixiv_events.DOWNLOAD_FINISHED, name=filename, status="downloaded", bytes=written, seconds=time.monotonic() - started)
+    return "downloaded", written
 
-    css_filename = "style.css"
+def download_image(illust, dest_folder, logger=print, session=None, index=None, page_workers=2, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Downloads every original page of an illustration, up to 'page_workers'
+    pages at a time. Returns (status, bytes) for the whole work: 'failed' if
+    any page failed, 'reused' if every page was already on disk.
+    """
+    pages = get_original_pages(illust)
+    if not pages:
+        return "failed", 0
+
+    def fetch(page):
+        stem, url = page
+        return download_page(url, dest_folder, stem, logger=logger, session=session, index=index, chunk_size=chunk_size)
+
+    if len(pages) == 1 or page_workers <= 1:
+        results = [fetch(page) for page in pages]
+    else:
+        with ThreadPoolExecutor(max_workers=min(page_workers, len(pages))) as executor:
+            results = list(executor.map(fetch, pages))
+
+    statuses = {status for status, _ in results}
+    written = sum(nbytes for _, nbytes in results)
+    if "failed" in statuses:
+        return "failed", written
+    if statuses == {"reused"}:
+        return "reused", 0
+    return "downloaded", written
 
-    html_content = f"""
+class DownloadPool:
+    """
+    Bounded background pool for original downloads.
+    Illustrations are queued with submit() while pagination continues;
+    close() waits for the queue to drain and returns a summary.
+    Each page of a manga work is its own job, at most 'page_workers' of
+    one work and 'per_host' per image host (default: 'workers') running at
+    once. Jobs wait in a queue until both have a free slot, so every pool
+    thread is always downloading. Counts in the summary are per file.
+    """
+    def __init__(self, dest_folder, workers=4, per_host=None, queue_size=256, page_workers=2, chunk_size=DOWNLOAD_CHUNK_SIZE, session=None, index=None, logger=print):
+        self.dest_folder = dest_folder
+        self.chunk_size = chunk_size
+        self.index = index
+        self.session = session or pixiv_http.get_session(pool_size=workers)
+        self.per_host = max(1, per_host or workers)
+        self.page_workers = max(1, page_workers)
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="download")
+        # Caps queued + running jobs so a huge hit list doesn't pile up in memory
+        self.pending = threading.BoundedSemaphore(max(1, queue_size))
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # Jobs not yet handed to the executor, and running jobs per host / work
+        self.waiting = collections.deque()
+        self.host_running = collections.Counter()
+        self.work_running = collections.Counter()
+        self.running = 0
+        self.submitted = set()
+        self.succeeded = 0
+        self.reused = 0
+        self.failed = 0
+        self.bytes_written = 0
+
+    def _dispatch(self):
+        # Called with self.lock held: starts every waiting job whose host and
+        # work have a free slot, in submission order
+        blocked = collections.deque()
+        while self.waiting:
+            job = self.waiting.popleft()
+            illust_id, stem, url, host = job
+            if self.host_running[host] >= self.per_host or self.work_running[illust_id] >= self.page_workers:
+                blocked.append(job)
+                continue
+            self.host_running[host] += 1
+            self.work_running[illust_id] += 1
+            self.running += 1
+            self.executor.submit(self._run, *job)
+        self.waiting = blocked
+
+    def _run(self, illust_id, stem, url, host):
+        try:
+            status, written = download_page(url, self.dest_folder, stem, logger=self.logger, session=self.session, index=self.index, chunk_size=self.chunk_size)
+        except Exception as e:
+            self.logger(f"  [!] Download worker error: {e}")
+            status, written = "failed", 0
+        finally:
+            self.pending.release()
+
+        with self.lock:
+            if status == "downloaded":
+                self.succeeded += 1
+                self.bytes_written += written
+            elif status == "reused":
+                self.reused += 1
+            else:
+                self.failed += 1
+            self.host_running[host] -= 1
+            self.work_running[illust_id] -= 1
+            if not self.work_running[illust_id]:
+                del self.work_running[illust_id]
+            self.running -= 1
+            self._dispatch()
+            if not self.running and not self.waiting:
+                self.idle.notify_all()
+
+    def submit(self, illust):
+        # Batch crawls can find the same work under several tags
+        illust_id = get_attr(illust, 'id')
+        with self.lock:
+            if illust_id in self.submitted:
+                return
+            self.submitted.add(illust_id)
+
+        pages = get_original_pages(illust)
+        if not pages:
+            with self.lock:
+                self.failed += 1
+            return
+        for stem, url in pages:
+            self.pending.acquire()
+            with self.lock:
+                self.waiting.append((illust_id, stem, url, urlparse(url).netloc if url else ""))
+                self._dispatch()
+
+    def close(self):
+        with self.lock:
+            while self.running or self.waiting:
+                self.idle.wait()
+        self.executor.shutdown(wait=True)
+        if self.index:
+            self.index.close()
+        return {
+            "succeeded": self.succeeded,
+            "reused": self.reused,
+            "failed": self.failed,
+            "bytes": self.bytes_written,
+        }
+
+def render_header(search_term, threshold, count, css_filename="style.css"):
+    return f"""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -120,7 +459,7 @@ def generate_html(illustrations, search_term, threshold, filename="output.html")
         <header>
             <div class="brand">
                 <h1>Pixiv Result: <span>{search_term}</span></h1>
-                <div class="subtitle">{len(illustrations)} images found (> {threshold} likes)</div>
+                <div class="subtitle">{count} images found (> {threshold} likes)</div>
             </div>
 
             <div class="controls">
@@ -138,125 +477,93 @@ def generate_html(illustrations, search_term, threshold, filename="output.html")
         <div class="container" id="grid">
     """
 
-    for illust in illustrations:
-        # Helper to get attributes safely
-        def get_attr(obj, key, default=None):
-            if isinstance(obj, dict):
-                return obj.get(key, default)
-            return getattr(obj, key, default)
-
-        # Image URLs
-        # Extract Original URL for High-Res downloading/viewing
-        orig_url = None
-        if isinstance(illust, dict):
-            # Try single page original
-            orig_url = illust.get('meta_single_page', {}).get('original_image_url')
-            if not orig_url:
-                # Try multi-page original
-                meta_pages = illust.get('meta_pages', [])
-                if meta_pages:
-                    orig_url = meta_pages[0].get('image_urls', {}).get('original')
-            
-            if not orig_url:
-                orig_url = illust.get('image_urls', {}).get('large')
-        
-        image_urls = get_attr(illust, 'image_urls')
-        if image_urls:
-            image_url_medium = get_attr(image_urls, 'square_medium')
-            # Use "large" (master) for the preview/lightbox (not the original P0)
-            image_url_preview = get_attr(image_urls, 'large') or get_attr(image_urls, 'medium')
-            # Use original URL specifically for the download action
-            image_url_original = orig_url or image_url_preview
-        else:
-            image_url_medium = "" 
-            image_url_preview = ""
-            image_url_original = ""
-        
-        # Proxy
-        def proxy_url(url):
-            if url:
-                return url.replace("i.pximg.net", "i.pixiv.re")
-            return "https://via.placeholder.com/300?text=No+Image"
-            
-        thumb_src = proxy_url(image_url_medium)
-        preview_src = proxy_url(image_url_preview)
-        original_src = proxy_url(image_url_original)
-        
-        illust_id = get_attr(illust, 'id')
-        title = get_attr(illust, 'title', 'Untitled')
-        user = get_attr(illust, 'user')
-        user_name = get_attr(user, 'name', 'Unknown') if user else 'Unknown'
-        bookmarks = get_attr(illust, 'total_bookmarks', 0)
-        create_date = get_attr(illust, 'create_date', '')
-
-        detail_url = f"https://www.pixiv.net/en/artworks/{illust_id}"
-        
-        # Card HTML
-        # thumb_src for card image
-        # preview_src for lightbox (master)
-        # original_src for actual download (P0)
-        html_content += f"""
-            <div class="card" data-likes="{bookmarks}" data-date="{create_date}" data-preview-url="{preview_src}" data-original-url="{original_src}" data-illust-id="{illust_id}">
-                <div class="image-wrapper">
-                    <img src="{thumb_src}" alt="{title}" loading="lazy">
-                    <div class="overlay-actions">
-                        <button class="action-btn" onclick="openLightbox('{preview_src}')" title="Preview">
-                            <svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 12a3 3 0 11-6 0 3 3 0 016 0z"/><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z"/></svg>
-                        </button>
-                        <button class="action-btn download-trigger" title="Download High-Res">
-                            <svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"/></svg>
-                        </button>
-                    </div>
-                    <a href="{detail_url}" target="_blank" class="pixiv-link" title="Open on Pixiv"></a>
+def card_fields(illust, thumbs=None, base_dir="results"):
+    """
+    Extracts what a report card shows: ids, text, and proxied image URLs.
+    With a ThumbnailCache, thumbnails already on disk are linked relative
+    to 'base_dir' (the report's folder) instead of through the proxy.
+    """
+    record = IllustRecord.from_illust(illust)
+    local_thumb = thumbs.local_path(record.thumb_url) if thumbs else None
+    if local_thumb:
+        thumb_src = os.path.relpath(local_thumb, base_dir).replace(os.sep, "/")
+    else:
+        thumb_src = proxy_url(record.thumb_url)
+    preview_src = proxy_url(record.preview_url)
+    # Use original URL specifically for the download action
+    original_src = proxy_url(record.original_url)
+    
+    return {
+        "id": record.id,
+        "title": record.title,
+        "user_name": record.user_name,
+        "bookmarks": record.total_bookmarks,
+        "create_date": record.create_date,
+        "thumb_src": thumb_src,
+        "preview_src": preview_src,
+        "original_src": original_src,
+        "page_count": record.page_count,
+    }
+
+def render_card(illust, thumbs=None, base_dir="results"):
+    fields = card_fields(illust, thumbs, base_dir)
+    illust_id = fields["id"]
+    title = fields["title"]
+    user_name = fields["user_name"]
+    bookmarks = fields["bookmarks"]
+    create_date = fields["create_date"]
+    thumb_src = fields["thumb_src"]
+    preview_src = fields["preview_src"]
+    original_src = fields["original_src"]
+    page_count = fields["page_count"]
+
+    detail_url = f"https://www.pixiv.net/en/artworks/{illust_id}"
+    
+    # Card HTML
+    # thumb_src for card image
+    # preview_src for lightbox (master)
+    # original_src for actual download (P0)
+    return f"""
+        <div class="card" data-likes="{bookmarks}" data-date="{create_date}" data-preview-url="{preview_src}" data-original-url="{original_src}" data-illust-id="{illust_id}">
+            <div class="image-wrapper">
+                <img src="{thumb_src}" alt="{title}" loading="lazy">
+                {f'<span class="page-count">{page_count}P</span>' if page_count > 1 else ''}
+                <div class="overlay-actions">
+                    <button class="action-btn" onclick="openLightbox('{preview_src}')" title="Preview">
+                        <svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 12a3 3 0 11-6 0 3 3 0 016 0z"/><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z"/></svg>
+                    </button>
+                    <button class="action-btn download-trigger" title="Download High-Res">
+                        <svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"/></svg>
+                    </button>
                 </div>
-                <div class="info">
-                    <div class="title" title="{title}">{title}</div>
-                    <div class="author">
-                        <svg width="14" height="14" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z"/></svg>
-                        {user_name}
-                    </div>
-                    <div class="stats">
-                        <span class="likes">
-                            <svg width="14" height="14" fill="currentColor" viewBox="0 0 20 20"><path fill-rule="evenodd" d="M3.172 5.172a4 4 0 015.656 0L10 6.343l1.172-1.171a4 4 0 115.656 5.656L10 17.657l-6.828-6.829a4 4 0 010-5.656z" clip-rule="evenodd"/></svg>
-                            {bookmarks}
-                        </span>
-                        <span class="date">{create_date[:10]}</span>
-                    </div>
+                <a href="{detail_url}" target="_blank" class="pixiv-link" title="Open on Pixiv"></a>
+            </div>
+            <div class="info">
+                <div class="title" title="{title}">{title}</div>
+                <div class="author">
+                    <svg width="14" height="14" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z"/></svg>
+                    {user_name}
+                </div>
+                <div class="stats">
+                    <span class="likes">
+                        <svg width="14" height="14" fill="currentColor" viewBox="0 0 20 20"><path fill-rule="evenodd" d="M3.172 5.172a4 4 0 015.656 0L10 6.343l1.172-1.171a4 4 0 115.656 5.656L10 17.657l-6.828-6.829a4 4 0 010-5.656z" clip-rule="evenodd"/></svg>
+                        {bookmarks}
+                    </span>
+                    <span class="date">{create_date[:10]}</span>
                 </div>
             </div>
-        """
-
-    html_content += """
         </div>
+    """
 
+LIGHTBOX_HTML = """
         <div class="lightbox" id="lightbox" onclick="closeLightbox()">
             <div class="close-btn">&times;</div>
             <img id="lightbox-img" src="" alt="Full view" onclick="event.stopPropagation()">
         </div>
+"""
 
-        <script>
-            function sortGrid(type) {
-                const container = document.getElementById('grid');
-                const cards = Array.from(container.getElementsByClassName('card'));
-                
-                cards.sort((a, b) => {
-                    if (type === 'likes') {
-                        const likesA = parseInt(a.dataset.likes);
-                        const likesB = parseInt(b.dataset.likes);
-                        return likesB - likesA; // Descending
-                    } else if (type === 'date') {
-                        const dateA = a.dataset.date;
-                        const dateB = b.dataset.date;
-                        return dateB.localeCompare(dateA); // Descending (Newest first)
-                    }
-                });
-
-                cards.forEach(card => container.appendChild(card));
-                
-                document.querySelectorAll('.sorting button').forEach(btn => btn.classList.remove('active'));
-                document.getElementById('btn-' + type).classList.add('active');
-            }
-
+# Download, lightbox and key handlers shared by the single-page report and the gallery
+REPORT_COMMON_JS = """
             async function downloadImage(url, filename, triggerElement = null) {
                 if (triggerElement) {
                     triggerElement.classList.add('loading');
@@ -296,6 +603,62 @@ def generate_html(illustrations, search_term, threshold, filename="output.html")
                 }
             }
 
+            // Handle individual download clicks
+            document.addEventListener('click', function(e) {
+                const trigger = e.target.closest('.download-trigger');
+                if (trigger) {
+                    e.preventDefault();
+                    const card = trigger.closest('.card');
+                    const url = card.dataset.originalUrl;
+                    const filename = card.dataset.illustId + ".jpg";
+                    downloadImage(url, filename, trigger);
+                }
+            });
+
+            function openLightbox(src) {
+                const lightbox = document.getElementById('lightbox');
+                const img = document.getElementById('lightbox-img');
+                img.src = src;
+                lightbox.classList.add('active');
+            }
+
+            function closeLightbox() {
+                document.getElementById('lightbox').classList.remove('active');
+            }
+            
+            document.addEventListener('keydown', function(event) {
+                if (event.key === "Escape") {
+                    closeLightbox();
+                }
+            });
+"""
+
+HTML_FOOTER = """
+        </div>
+""" + LIGHTBOX_HTML + """
+        <script>
+            function sortGrid(type) {
+                const container = document.getElementById('grid');
+                const cards = Array.from(container.getElementsByClassName('card'));
+                
+                cards.sort((a, b) => {
+                    if (type === 'likes') {
+                        const likesA = parseInt(a.dataset.likes);
+                        const likesB = parseInt(b.dataset.likes);
+                        return likesB - likesA; // Descending
+                    } else if (type === 'date') {
+                        const dateA = a.dataset.date;
+                        const dateB = b.dataset.date;
+                        return dateB.localeCompare(dateA); // Descending (Newest first)
+                    }
+                });
+
+                cards.forEach(card => container.appendChild(card));
+                
+                document.querySelectorAll('.sorting button').forEach(btn => btn.classList.remove('active'));
+                document.getElementById('btn-' + type).classList.add('active');
+            }
+
             async function downloadAll() {
                 const cards = Array.from(document.querySelectorAll('.card'));
                 if (!confirm(`Are you sure you want to download ${cards.length} high-resolution images?`)) return;
@@ -322,99 +685,346 @@ def generate_html(illustrations, search_term, threshold, filename="output.html")
                     btn.textContent = 'Download All (Browser)';
                 }
             }
+""" + REPORT_COMMON_JS + """
+        </script>
+    </body>
+    </html>
+    """
 
-            // Handle individual download clicks
-            document.addEventListener('click', function(e) {
-                const trigger = e.target.closest('.download-trigger');
-                if (trigger) {
-                    e.preventDefault();
-                    const card = trigger.closest('.card');
-                    const url = card.dataset.originalUrl;
-                    const filename = card.dataset.illustId + ".jpg";
-                    downloadImage(url, filename, trigger);
+def generate_html(illustrations, search_term, threshold, filename="output.html", thumbs=None):
+    # Create results directory if it doesn't exist
+    output_dir = "results"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    filepath = os.path.join(output_dir, filename)
+
+    # Sort by likes descending by default for the initial render
+    pixiv_filter.rank(illustrations)
+
+    # Stream header, cards and footer straight to disk so memory stays flat
+    # no matter how many cards there are
+    with open(filepath, "w", encoding="utf-8", buffering=1024 * 1024) as f:
+        f.write(render_header(search_term, threshold, len(illustrations)))
+        for illust in illustrations:
+            f.write(render_card(illust, thumbs, output_dir))
+        f.write(HTML_FOOTER)
+    
+    return os.path.abspath(filepath)
+
+# Gallery shell: card data lives in data-NNN.js shards loaded with <script> tags
+# (fetch() of local JSON is blocked on file:// pages). Sorting works on the data
+# arrays and only PAGE_SIZE cards are added to the DOM at a time.
+GALLERY_SCRIPT = """
+        <div id="sentinel" class="sentinel"></div>
+""" + LIGHTBOX_HTML + """
+        <script>
+            // Row layout: [id, title, user, likes, date, thumb, preview, original, pages]
+            const PAGE_SIZE = 120;
+            const rows = [];
+            let view = rows;
+            let rendered = 0;
+            let sortType = 'likes';
+            let shardsLoaded = 0;
+
+            function escapeHtml(value) {
+                return String(value).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+            }
+
+            function cardHtml(row) {
+                const [id, title, user, likes, date, thumb, preview, original, pages] = row.map(escapeHtml);
+                return `
+                <div class="card" data-likes="${likes}" data-date="${date}" data-preview-url="${preview}" data-original-url="${original}" data-illust-id="${id}">
+                    <div class="image-wrapper">
+                        <img src="${thumb}" alt="${title}" loading="lazy">
+                        ${pages > 1 ? `<span class="page-count">${pages}P</span>` : ''}
+                        <div class="overlay-actions">
+                            <button class="action-btn" onclick="openLightbox(this.closest('.card').dataset.previewUrl)" title="Preview">
+                                <svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 12a3 3 0 11-6 0 3 3 0 016 0z"/><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z"/></svg>
+                            </button>
+                            <button class="action-btn download-trigger" title="Download High-Res">
+                                <svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"/></svg>
+                            </button>
+                        </div>
+                        <a href="https://www.pixiv.net/en/artworks/${id}" target="_blank" class="pixiv-link" title="Open on Pixiv"></a>
+                    </div>
+                    <div class="info">
+                        <div class="title" title="${title}">${title}</div>
+                        <div class="author">
+                            <svg width="14" height="14" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z"/></svg>
+                            ${user}
+                        </div>
+                        <div class="stats">
+                            <span class="likes">
+                                <svg width="14" height="14" fill="currentColor" viewBox="0 0 20 20"><path fill-rule="evenodd" d="M3.172 5.172a4 4 0 015.656 0L10 6.343l1.172-1.171a4 4 0 115.656 5.656L10 17.657l-6.828-6.829a4 4 0 010-5.656z" clip-rule="evenodd"/></svg>
+                                ${likes}
+                            </span>
+                            <span class="date">${date.slice(0, 10)}</span>
+                        </div>
+                    </div>
+                </div>`;
+            }
+
+            function renderMore() {
+                if (rendered >= view.length) return;
+                const end = Math.min(rendered + PAGE_SIZE, view.length);
+                const html = [];
+                for (let i = rendered; i < end; i++) html.push(cardHtml(view[i]));
+                document.getElementById('grid').insertAdjacentHTML('beforeend', html.join(''));
+                rendered = end;
+            }
+
+            function applySort() {
+                if (sortType === 'date') {
+                    view = rows.slice().sort((a, b) => b[4].localeCompare(a[4])); // Newest first
+                } else {
+                    view = rows; // Shards are written in likes order
                 }
-            });
+                rendered = 0;
+                document.getElementById('grid').innerHTML = '';
+                renderMore();
+            }
 
-            function openLightbox(src) {
-                const lightbox = document.getElementById('lightbox');
-                const img = document.getElementById('lightbox-img');
-                img.src = src;
-                lightbox.classList.add('active');
+            function sortGrid(type) {
+                sortType = type;
+                applySort();
+                window.scrollTo(0, 0);
+                document.querySelectorAll('.sorting button').forEach(btn => btn.classList.remove('active'));
+                document.getElementById('btn-' + type).classList.add('active');
             }
 
-            function closeLightbox() {
-                document.getElementById('lightbox').classList.remove('active');
+            async function downloadAll() {
+                if (!confirm(`Are you sure you want to download ${rows.length} high-resolution images?`)) return;
+
+                const btn = document.querySelector('.download-all-btn');
+                if (btn) {
+                    btn.classList.add('loading');
+                    btn.textContent = 'Downloading...';
+                }
+
+                for (const row of view) {
+                    await downloadImage(row[7], row[0] + ".jpg");
+                    // 300ms delay to prevent browser congesting
+                    await new Promise(r => setTimeout(r, 300));
+                }
+
+                if (btn) {
+                    btn.classList.remove('loading');
+                    btn.textContent = 'Download All (Browser)';
+                }
             }
-            
-            document.addEventListener('keydown', function(event) {
-                if (event.key === "Escape") {
-                    closeLightbox();
+
+            // Called by each data-NNN.js shard
+            function pixivShard(index, shardRows) {
+                for (const row of shardRows) rows.push(row);
+                shardsLoaded++;
+                if (sortType !== 'likes' && shardsLoaded === SHARD_COUNT) {
+                    applySort();
+                } else if (sortType === 'likes' && rendered < PAGE_SIZE) {
+                    renderMore();
                 }
-            });
+                if (shardsLoaded < SHARD_COUNT) loadShard(shardsLoaded);
+            }
+
+            function loadShard(index) {
+                const script = document.createElement('script');
+                script.src = 'data-' + String(index).padStart(3, '0') + '.js';
+                document.body.appendChild(script);
+            }
+
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) renderMore();
+            }, {rootMargin: '1500px'}).observe(document.getElementById('sentinel'));
+
+            if (SHARD_COUNT > 0) loadShard(0);
+""" + REPORT_COMMON_JS + """
         </script>
     </body>
     </html>
     """
-    
+
+def generate_gallery(illustrations, search_term, threshold, dirname="gallery", shard_size=2000, thumbs=None):
+    """
+    Writes 'results/<dirname>/index.html', a small shell that renders cards in
+    pages, plus the card data as compact JSON shards (data-000.js, ...).
+    Meant for result sets too large for the single-page report.
+    """
+    output_dir = os.path.join("results", dirname)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Drop shards from an earlier, larger report
+    for name in os.listdir(output_dir):
+        if name.startswith("data-") and name.endswith(".js"):
+            os.remove(os.path.join(output_dir, name))
+
+    # Sort by likes descending; the shell relies on this order
+    pixiv_filter.rank(illustrations)
+
+    shard_count = 0
+    for start in range(0, len(illustrations), shard_size):
+        rows = []
+        for illust in illustrations[start:start + shard_size]:
+            fields = card_fields(illust, thumbs, output_dir)
+            rows.append([
+                fields["id"], fields["title"], fields["user_name"], fields["bookmarks"],
+                fields["create_date"], fields["thumb_src"], fields["preview_src"], fields["original_src"], fields["page_count"],
+            ])
+        shard_path = os.path.join(output_dir, f"data-{shard_count:03d}.js")
+        with open(shard_path, "w", encoding="utf-8") as f:
+            f.write(f"pixivShard({shard_count}, ")
+            json.dump(rows, f, ensure_ascii=False, separators=(",", ":"))
+            f.write(");\n")
+        shard_count += 1
+
+    filepath = os.path.join(output_dir, "index.html")
     with open(filepath, "w", encoding="utf-8") as f:
-        f.write(html_content)
-    
+        f.write(render_header(search_term, threshold, len(illustrations), css_filename="../style.css"))
+        f.write("\n        </div>\n")
+        f.write(f"\n        <script>const SHARD_COUNT = {shard_count};</script>\n")
+        f.write(GALLERY_SCRIPT)
+
     return os.path.abspath(filepath)
 
-def run_sorter(search_term, threshold=1000, pages=5, r18=False, delay=2.5, start_page=1, no_limit=False, auto_download=False, logger=print):
-    api = AppPixivAPI()
-    
-    # Try to load token from environment or file
-    token_file = "refresh_token.txt"
-    refresh_token = os.environ.get("PIXIV_REFRESH_TOKEN")
-    if not refresh_token:
-        if os.path.exists(token_file):
-            with open(token_file, "r") as f:
-                refresh_token = f.read().strip()
-    
-    def perform_login(current_token):
-        if current_token:
-            logger("Logging in...")
-            try:
-                api.auth(refresh_token=current_token)
-                return True
-            except Exception as e:
-                logger(f"Login with existing token failed: {e}")
-        
-        logger("\n[!] Token expired or missing. Starting authentication flow...")
-        new_token = pixiv_auth.login()
-        if new_token:
-            with open(token_file, "w") as f:
-                f.write(new_token)
-            logger("New token saved. Retrying login...")
+class SearchPager:
+    """
+    Walks a search_illust next_url chain, yielding (page_number, json_result).
+    Stops on a missing or circular next_url, the page limit or the safety cap.
+    'exhausted' is set when the chain itself ended (nothing left to crawl) and
+    'stop_reason' records why it stopped: end, circular, limit, cap, parse, error.
+    """
+    def __init__(self, fetch_page, parse_qs, first_result, start_page=1, pages=5, no_limit=False, pages_done=0, seen_urls=None, logger=print):
+        self.fetch_page = fetch_page
+        self.parse_qs = parse_qs
+        self.first_result = first_result
+        self.start_page = start_page
+        self.pages = pages
+        self.no_limit = no_limit
+        # Pages already processed by an earlier, resumed run
+        self.pages_done = pages_done
+        self.logger = logger
+        self.seen_urls = set(seen_urls or ())
+        self.exhausted = False
+        self.stop_reason = None
+
+    def __iter__(self):
+        json_result = self.first_result
+        current_page_number = self.start_page
+        pages_processed = self.pages_done
+
+        while True:
+            yield current_page_number, json_result
+            pages_processed += 1
+
+            next_url = json_result.get('next_url')
+            
+            # Stop if no next_url
+            if not next_url:
+                self.logger("End of results (no next page).")
+                self.exhausted = True
+                self.stop_reason = "end"
+                return
+                
+            # Stop if we see the same URL again (circular pagination)
+            if next_url in self.seen_urls:
+                self.logger("Circular pagination detected. Stopping.")
+                self.exhausted = True
+                self.stop_reason = "circular"
+                return
+            self.seen_urls.add(next_url)
+
+            # Handle page limit
+            if not self.no_limit and pages_processed >= self.pages:
+                self.logger(f"Reached page limit ({self.pages}). Stopping.")
+                self.stop_reason = "limit"
+                return
+            
+            # Safety cap to prevent infinite runs (e.g. 2000 pages)
+            if pages_processed >= 2000:
+                self.logger("Reached safety cap of 2000 pages. Stopping.")
+                self.stop_reason = "cap"
+                return
+                
+            next_qs = self.parse_qs(next_url)
+            if not next_qs:
+                self.logger("Could not parse next page parameters. Stopping.")
+                self.stop_reason = "parse"
+                return
+                
             try:
-                api.auth(refresh_token=new_token)
-                return True
+                json_result = self.fetch_page(next_qs)
+                current_page_number += 1
             except Exception as e:
-                logger(f"Login with new token failed: {e}")
-        return False
+                self.logger(f"API Error fetching next page: {e}")
+                self.stop_reason = "error"
+                return
 
-    if not perform_login(refresh_token):
-        logger("Could not authenticate. Exiting.")
-        return
+def prefetch(iterable, depth=1):
+    """
+    Runs 'iterable' in a background thread, staying at most 'depth' items
+    ahead of the consumer. Closing (or breaking out of) the returned
+    generator stops the producer before it fetches anything else.
+    """
+    items = queue.Queue()
+    slots = threading.Semaphore(depth)
+    stop = threading.Event()
+    done = object()
 
-    # Create results directory if it doesn't exist
-    output_dir = "results"
+    def produce():
+        iterator = iter(iterable)
+        error = None
+        try:
+            while not stop.is_set():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                items.put((item, None))
+                # Wait until the consumer is done with an earlier item
+                slots.acquire()
+        except Exception as e:
+            error = e
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            items.put((done, error))
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+
+    first = True
+    try:
+        while True:
+            if not first:
+                slots.release()
+            first = False
+            item, error = items.get()
+            if item is done:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        slots.release()
+
+def get_resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+def copy_stylesheet(output_dir="results", logger=print):
+    """
+    Copies style.css next to the reports (Ensure consistent styling)
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Copy style.css to results directory (Ensure consistent styling)
-    def get_resource_path(relative_path):
-        """ Get absolute path to resource, works for dev and for PyInstaller """
-        try:
-            # PyInstaller creates a temp folder and stores path in _MEIPASS
-            base_path = sys._MEIPASS
-        except Exception:
-            base_path = os.path.abspath(".")
-        return os.path.join(base_path, relative_path)
-
     css_filename = "style.css"
-    css_src = get_resource_path("style.css")
+    css_src = get_resource_path(css_filename)
     css_dst = os.path.join(output_dir, css_filename)
     
     if os.path.exists(css_src):
@@ -423,103 +1033,628 @@ def run_sorter(search_term, threshold=1000, pages=5, r18=False, delay=2.5, start
     else:
         logger(f"[!] Warning: {css_filename} not found at {css_src}")
 
-    download_folder = None
-    if auto_download:
-        download_folder = get_unique_download_path(search_term, threshold)
-        logger(f"Auto-download enabled. Images will be saved to: {download_folder}")
+def write_report(filtered_illusts, search_term, threshold, report="html", name=None, thumbs=None, logger=print):
+    if filtered_illusts:
+        if thumbs:
+            # Most were fetched during the crawl; this picks up older hits
+            for illust in filtered_illusts:
+                thumbs.submit(get_thumbnail_url(illust))
+            thumbs.wait()
+            logger(f"Thumbnails: {thumbs.fetched} fetched, {thumbs.failed} failed")
+        if report == "gallery":
+            output_file = generate_gallery(filtered_illusts, search_term, threshold, dirname=name or "gallery", thumbs=thumbs)
+        else:
+            output_file = generate_html(filtered_illusts, search_term, threshold, filename=f"{name or 'output'}.html", thumbs=thumbs)
+        logger(f"Results saved to: {output_file}")
+        import webbrowser
+        webbrowser.open(f"file://{output_file}")
+    else:
+        logger("No images found with that threshold.")
 
-    logger(f"Searching for '{search_term}' starting at page {start_page} with threshold {threshold}...")
-    
-    # Calculate offset
-    start_offset = (start_page - 1) * 30
-
-    json_result = api.search_illust(
-        search_term, 
-        search_target="partial_match_for_tags",
-        sort="date_desc", 
-        filter="for_ios",
-        offset=start_offset
-    )
+def render_from_cache(search_term, threshold=1000, r18=False, cache_path=pixiv_cache.DEFAULT_CACHE_PATH, report="html", local_thumbs=False, rules=None, logger=print):
+    """
+    Rebuilds the report for a previously crawled search term straight from
+    the metadata cache. No login and no API calls.
+    """
+    if not os.path.exists(cache_path):
+        logger(f"[!] No cache found at {cache_path}.")
+        return
+
+    cache = pixiv_cache.IllustCache(cache_path)
+    try:
+        illusts = cache.illusts_for_term(search_term)
+    finally:
+        cache.close()
+
+    logger(f"Loaded {len(illusts)} cached illustrations for '{search_term}'.")
+    filtered_illusts = [IllustRecord.from_illust(illust) for illust in pixiv_filter.filter_page(illusts, threshold, r18, rules)]
+    logger(f"Found {len(filtered_illusts)} images matching the criteria.")
+
+    copy_stylesheet(logger=logger)
+    thumbs = pixiv_cache.ThumbnailCache(logger=logger) if local_thumbs else None
+    try:
+        write_report(filtered_illusts, search_term, threshold, report=report, thumbs=thumbs, logger=logger)
+    finally:
+        if thumbs:
+            thumbs.close()
+
+def merge_incremental(new_hits, watermark, search_term, threshold, r18, newest_id, newest_date, crawl_complete, rules=None, logger=print):
+    """
+    Merges this run's hits with the previous incremental run and saves the
+    new high-water mark. The mark only advances when the crawl covered
+    everything back to the old one; otherwise the gap would never be crawled.
+    This run's hits already passed its filter; the previous run's may come
+    from other settings and are checked against the threshold and the
+    numeric 'rules' (records carry no tags).
+    """
+    merged = {}
+    old_hits = [IllustRecord.from_dict(hit) for hit in watermark['hits']] if watermark else []
+    old_hits = pixiv_filter.filter_page(old_hits, threshold, r18, rules.without_tags() if rules else None)
+    for illust in old_hits + new_hits:
+        # Later entries are newer copies (fresher bookmark counts)
+        merged[illust.id] = illust
+    hits = list(merged.values())
+
+    if crawl_complete:
+        mark_id, mark_date = newest_id, newest_date
+        if watermark and watermark['newest_id'] >= newest_id:
+            mark_id, mark_date = watermark['newest_id'], watermark['newest_date']
+    elif watermark:
+        logger("[!] Crawl stopped before reaching the last run's position; high-water mark not advanced.")
+        mark_id, mark_date = watermark['newest_id'], watermark['newest_date']
+    else:
+        # A partial first run has no safe mark yet
+        mark_id, mark_date = 0, ""
+
+    pixiv_state.save_watermark(search_term, r18, mark_id, mark_date, [hit.to_dict() for hit in hits])
+    logger(f"Incremental mode: {len(new_hits)} new hits, {len(hits)} in total.")
+    return hits
+
+def preload():
+    """
+    Imports what pixiv_sorter defers at import time (pixivpy3 and requests),
+    so a caller can pay for it in the background before the first request.
+    """
+    import requests
+    import pixivpy3
+
+def load_refresh_token(token_file="refresh_token.txt"):
+    # Try to load token from environment or file
+    refresh_token = os.environ.get("PIXIV_REFRESH_TOKEN")
+    if not refresh_token:
+        if os.path.exists(token_file):
+            with open(token_file, "r") as f:
+                refresh_token = f.read().strip()
+    return refresh_token
+
+class SearchClient:
+    """
+    One AppPixivAPI login shared by every crawl of a run, with the optional
+    metadata cache and a single adaptive rate limit for all page requests.
+    'api' replaces the AppPixivAPI instance (e.g. one pointed at a test server).
+    Access tokens come from the shared cache at 'token_cache' (see pixiv_token).
+    """
+    def __init__(self, delay=2.5, max_rate=1.0, max_retries=5, use_cache=False, cache_path=pixiv_cache.DEFAULT_CACHE_PATH, token_file="refresh_token.txt", token_cache=pixiv_token.DEFAULT_TOKEN_PATH, api=None, logger=print):
+        if api is None:
+            # pixivpy3 (and requests with it) loads here, not at import time
+            from pixivpy3 import AppPixivAPI
+            api = AppPixivAPI()
+        self.api = api
+        self.token_file = token_file
+        self.refresh_token = load_refresh_token(token_file)
+        self.auth = pixiv_token.AuthManager(self.api, self.refresh_token, path=token_cache, logger=logger)
+        self.max_retries = max_retries
+        self.logger = logger
+        self.cache = pixiv_cache.IllustCache(cache_path) if use_cache else None
+        # 'delay' is the starting interval; the limiter speeds up toward max_rate while the API is healthy
+        self.limiter = pixiv_http.AdaptiveRateLimiter(rate=1 / max(delay, 0.01), max_rate=max(max_rate, 1 / max(delay, 0.01)))
+        self.logged_in = False
+        # From the OAuth response; None until logged in
+        self.is_premium = None
+        self.login_lock = threading.Lock()
+
+    def _authenticate(self, refresh_token, force=False):
+        self.auth.refresh_token = refresh_token
+        if self.auth.login(force=force):
+            self.logger("Using cached access token.")
+        self.is_premium = self.auth.is_premium
+        self.logged_in = True
+
+    def perform_login(self, force=False):
+        """
+        Logs in with the stored refresh token, falling back to the
+        interactive login flow. 'force' skips a cached access token the API
+        has just rejected.
+        """
+        logger = self.logger
+        with self.login_lock:
+            if self.refresh_token:
+                logger("Logging in...")
+                try:
+                    self._authenticate(self.refresh_token, force=force)
+                    return True
+                except Exception as e:
+                    logger(f"Login with existing token failed: {e}")
+            
+            logger("\n[!] Token expired or missing. Starting authentication flow...")
+            new_token = pixiv_auth.login()
+            if new_token:
+                pixiv_token.save_refresh_token(self.token_file, new_token)
+                self.refresh_token = new_token
+                logger("New token saved. Retrying login...")
+                try:
+                    self._authenticate(new_token)
+                    return True
+                except Exception as e:
+                    logger(f"Login with new token failed: {e}")
+            return False
+
+    def fetch_page(self, qs, logger=None):
+        """
+        Serves a search page from the cache when it is fresh; otherwise logs in
+        on first use and asks the API through the rate limiter, retrying
+        throttled or failed requests with backoff.
+        """
+        logger = logger or self.logger
+        if self.cache:
+            cached = self.cache.get_page(qs)
+            if cached is not None:
+                pixiv_events.emit(logger, pixiv_events.PAGE_FETCHED, cached=True, offset=qs.get('offset'), illusts=len(cached['illusts']))
+                return cached
+
+        if not self.logged_in:
+            if not self.perform_login():
+                raise RuntimeError("Could not authenticate.")
+
+        for attempt in range(self.max_retries + 1):
+            waited = self.limiter.acquire()
+            if waited:
+                pixiv_events.emit(logger, pixiv_events.RATE_LIMIT_WAIT, seconds=waited)
+            started = time.monotonic()
+            try:
+                json_result = self.api.search_illust(**qs)
+                error = json_result.get('error')
+            except Exception as e:
+                error = e
+
+            if not error:
+                self.limiter.success()
+                pixiv_events.emit(
+                    logger, pixiv_events.PAGE_FETCHED, cached=False, offset=qs.get('offset'),
+                    illusts=len(json_result.get('illusts', [])), seconds=time.monotonic() - started,
+                    rate=self.limiter.current_rate
+                )
+                if self.cache and 'illusts' in json_result:
+                    self.cache.store_page(qs, json_result)
+                return json_result
+
+            message = str(error.get('message') or error) if isinstance(error, dict) else str(error)
+            if "offset" in message.lower():
+                # Requests past the search offset ceiling never succeed
+                raise RuntimeError(message)
+            if attempt == self.max_retries:
+                raise RuntimeError(f"Giving up after {self.max_retries} retries: {message}")
+
+            if "oauth" in message.lower() or "invalid_grant" in message.lower():
+                # Access tokens expire after an hour; long crawls need a fresh one
+                logger("  [!] Access token expired. Logging in again...")
+                if not self.perform_login(force=True):
+                    raise RuntimeError("Could not authenticate.")
+                continue
+
+            pause = self.limiter.throttled()
+            pixiv_events.emit(logger, pixiv_events.THROTTLED, message=message, pause=pause, rate=self.limiter.current_rate)
+            logger(f"  [!] Page request failed ({message}). Retrying in {pause:.0f}s at {self.limiter.current_rate:.2f} req/s...")
+
+    def close(self):
+        self.auth.close()
+        if self.cache:
+            self.cache.close()
+
+def first_search_query(search_term, start_page=1):
+    """
+    search_illust parameters for the first page; later pages follow next_url.
+    """
+    return {
+        "word": search_term,
+        "search_target": "partial_match_for_tags",
+        "sort": "date_desc",
+        "filter": "for_ios",
+        # 30 results per page
+        "offset": (start_page - 1) * 30,
+    }
+
+def is_last_page(illusts, previous_page_ids, current_page_number, logger=print):
+    """
+    True if pagination should stop at this page: it is empty, or repeats the
+    previous one (Pixiv returns the last valid page again past the limit).
+    """
+    if not illusts:
+        logger(f"No more illustrations found. Stopping at page {current_page_number}.")
+        return True
+    current_page_ids = {illust.get('id') for illust in illusts}
+    if previous_page_ids and current_page_ids == previous_page_ids:
+        logger(f"Duplicate page detected at page {current_page_number}. Stopping.")
+        return True
+    return False
+
+def crawl(client, search_term, threshold=1000, pages=5, r18=False, start_page=1, no_limit=False, incremental=False, prefetch_pages=1, download_pool=None, thumbs=None, resume=False, checkpoint_every=10, strategy="auto", since=None, until=None, window_days=None, exporter=None, rules=None, logger=print):
+    """
+    Crawls one search term through 'client' and returns the matching
+    illustrations (merged with earlier results in incremental mode).
+    Every 'checkpoint_every' pages the position and hits are saved so an
+    interrupted crawl can continue with resume=True.
+    New hits also go to 'exporter' (see pixiv_export), flushed per page.
+    'rules' adds pixiv_filter.FilterRules on top of threshold and r18.
+    'strategy' (see pixiv_search) and a date range switch to crawl_queries();
+    incremental and resumed crawls always use the plain date scan.
+    """
+    strategy = pixiv_search.resolve_strategy(strategy, client.is_premium, threshold, logger=logger)
+    if strategy != "scan" or since or until:
+        if incremental or resume:
+            logger("[!] Incremental and resumed crawls use the date scan without a date range.")
+        else:
+            if strategy != "scan":
+                logger(f"Search strategy: {strategy}.")
+            if start_page != 1:
+                logger("[!] --start_page is ignored with a search strategy or date range.")
+            queries = pixiv_search.build_queries(search_term, threshold, strategy, since=since, until=until, window_days=window_days)
+            return crawl_queries(
+                client, queries, threshold=threshold, pages=pages, r18=r18, no_limit=no_limit,
+                prefetch_pages=prefetch_pages, stop_below_threshold=(strategy == "popular"),
+                download_pool=download_pool, thumbs=thumbs, exporter=exporter, rules=rules, logger=logger
+            )
+
+    # Incremental mode: stop at the newest illust seen by the last run of this (term, r18)
+    watermark = None
+    if incremental:
+        watermark = pixiv_state.load_watermark(search_term, r18)
+        if start_page != 1:
+            logger("[!] Incremental mode always starts from page 1.")
+            start_page = 1
+        if watermark and watermark['newest_id']:
+            logger(f"Incremental mode: stopping at illust {watermark['newest_id']} ({watermark['newest_date'][:10]}) from the last run.")
+        else:
+            logger("Incremental mode: no previous run found, doing a full crawl.")
 
     filtered_illusts = []
-    pages_processed = 0
-    current_page_number = start_page
-    seen_urls = set()
     previous_page_ids = set()
+    seen_urls = set()
+    pages_done = 0
+    newest_id = 0
+    newest_date = ""
+    # True once everything newer than the watermark (or the whole tag) has been seen
+    crawl_complete = False
+
+    checkpoint = pixiv_state.CrawlCheckpoint(search_term, threshold, r18) if checkpoint_every else None
+    resumed = checkpoint.load() if checkpoint and resume else None
+    if resumed:
+        position, hits = resumed
+        filtered_illusts = [IllustRecord.from_dict(hit) for hit in hits]
+        first_qs = client.api.parse_qs(position['next_url'])
+        start_page = position['page_number']
+        pages_done = position['pages_done']
+        seen_urls = set(position['seen_urls'])
+        previous_page_ids = set(position['previous_page_ids'])
+        newest_id = position['newest_id']
+        newest_date = position['newest_date']
+        logger(f"Resuming '{search_term}' at page {start_page} with {len(filtered_illusts)} hits from the checkpoint...")
+    else:
+        if resume:
+            logger("[!] No checkpoint found for this search. Starting from the beginning.")
+        if checkpoint:
+            checkpoint.clear()
+
+        logger(f"Searching for '{search_term}' starting at page {start_page} with threshold {threshold}...")
+        first_qs = first_search_query(search_term, start_page)
+
+    try:
+        json_result = client.fetch_page(first_qs, logger=logger)
+    except Exception as e:
+        logger(f"API Error fetching first page: {e}")
+        return []
+
+    # Position of the next unprocessed page, for checkpoints
+    resume_url = position['next_url'] if resumed else None
+    resume_page = start_page
+    # Hits up to the end of the last finished page; an interrupted page is
+    # left out of checkpoints and crawled again on resume
+    committed_hits = len(filtered_illusts)
+
+    def save_checkpoint():
+        if not checkpoint or not resume_url:
+            return
+        checkpoint.save({
+            "search_term": search_term,
+            "threshold": threshold,
+            "r18": r18,
+            "next_url": resume_url,
+            "page_number": resume_page,
+            "pages_done": pages_done,
+            "seen_urls": sorted(seen_urls),
+            "previous_page_ids": sorted(previous_page_ids),
+            "newest_id": newest_id,
+            "newest_date": newest_date,
+        }, filtered_illusts[:committed_hits])
+
+    pager = SearchPager(lambda qs: client.fetch_page(qs, logger=logger), client.api.parse_qs, json_result, start_page=start_page, pages=pages, no_limit=no_limit, pages_done=pages_done, seen_urls=seen_urls, logger=logger)
+    # With prefetching, page N+1 is requested while page N is being filtered
+    page_stream = prefetch(pager, prefetch_pages) if prefetch_pages > 0 else iter(pager)
     
-    while True:
-        illusts = json_result.get('illusts', [])
-        pages_processed += 1
-        
-        # If we reached a page with no illustrations, stop immediately
-        if not illusts:
-            logger(f"No more illustrations found. Stopping at page {current_page_number}.")
-            break
-
-        # Check for duplicate results (Pixiv API sometimes returns the last valid page if requested page > limit)
-        current_page_ids = {illust.get('id') for illust in illusts}
-        if previous_page_ids and current_page_ids == previous_page_ids:
-            logger(f"Duplicate page detected at page {current_page_number}. Stopping.")
-            break
-        previous_page_ids = current_page_ids
-
-        logger(f"Processing page {current_page_number} ({len(illusts)} items)...")
-
-        for illust in illusts:
-            x_restrict = illust.get('x_restrict', 0) if isinstance(illust, dict) else getattr(illust, 'x_restrict', 0)
-            if x_restrict > 0 and not r18:
-                continue
-            
-            bookmarks = illust.get('total_bookmarks', 0) if isinstance(illust, dict) else getattr(illust, 'total_bookmarks', 0)
-            if bookmarks >= threshold:
-                filtered_illusts.append(illust)
-                if auto_download:
-                    download_image(illust, download_folder, logger=logger)
-
-        next_url = json_result.get('next_url')
-        
-        # Stop if no next_url
-        if not next_url:
-            logger("End of results (no next page).")
-            break
-            
-        # Stop if we see the same URL again (circular pagination)
-        if next_url in seen_urls:
-            logger("Circular pagination detected. Stopping.")
-            break
-        seen_urls.add(next_url)
-
-        # Handle page limit
-        if not no_limit and pages_processed >= pages:
-            logger(f"Reached page limit ({pages}). Stopping.")
-            break
-        
-        # Safety cap to prevent infinite runs (e.g. 2000 pages)
-        if pages_processed >= 2000:
-            logger("Reached safety cap of 2000 pages. Stopping.")
-            break
-            
-        next_qs = api.parse_qs(next_url)
-        if not next_qs:
-            logger("Could not parse next page parameters. Stopping.")
-            break
+    pages_since_checkpoint = 0
+    try:
+        for current_page_number, json_result in page_stream:
+            illusts = json_result.get('illusts', [])
             
-        time.sleep(delay)
+            current_page_ids = {illust.get('id') for illust in illusts}
+            if is_last_page(illusts, previous_page_ids, current_page_number, logger=logger):
+                crawl_complete = True
+                break
+
+            logger(f"Processing page {current_page_number} ({len(illusts)} items, {client.limiter.current_rate:.2f} req/s)...")
+
+            reached_watermark = False
+            if watermark:
+                # Everything from the first already-seen illust on is old
+                fresh = list(itertools.takewhile(lambda illust: illust.get('id', 0) > watermark['newest_id'], illusts))
+                reached_watermark = len(fresh) < len(illusts)
+                illusts = fresh
+            newest = max(illusts, key=lambda illust: illust.get('id', 0)) if illusts else None
+
+            for illust in pixiv_filter.filter_page(illusts, threshold, r18, rules):
+                record = IllustRecord.from_illust(illust)
+                filtered_illusts.append(record)
+                pixiv_events.emit(logger, pixiv_events.HIT_FOUND, id=record.id, bookmarks=record.total_bookmarks)
+                if download_pool:
+                    download_pool.submit(record)
+                if thumbs:
+                    thumbs.submit(record.thumb_url)
+                if exporter:
+                    exporter.add(illust)
+            if exporter:
+                exporter.flush()
+
+            # This page is done; the crawl would continue from its next_url
+            committed_hits = len(filtered_illusts)
+            previous_page_ids = current_page_ids
+            if newest and newest.get('id', 0) > newest_id:
+                newest_id = newest.get('id', 0)
+                newest_date = newest.get('create_date', '')
+            pages_done += 1
+            resume_url = json_result.get('next_url')
+            resume_page = current_page_number + 1
+            if resume_url:
+                seen_urls.add(resume_url)
+
+            if reached_watermark:
+                logger("Reached the last run's newest illustration. Stopping.")
+                crawl_complete = True
+                break
+
+            pages_since_checkpoint += 1
+            if checkpoint and pages_since_checkpoint >= checkpoint_every:
+                save_checkpoint()
+                pages_since_checkpoint = 0
+        else:
+            crawl_complete = pager.exhausted
+    except BaseException:
+        # Ctrl-C, GUI shutdown, unexpected errors: keep what we have
+        save_checkpoint()
+        raise
+    finally:
+        page_stream.close()
+
+    if checkpoint:
+        if not crawl_complete and pager.stop_reason in ("error", "parse"):
+            save_checkpoint()
+            logger(f"Checkpoint saved. Run again with --resume to continue from page {resume_page}.")
+        else:
+            checkpoint.clear()
+
+    logger(f"Found {len(filtered_illusts)} images matching the criteria.")
+
+    if incremental:
+        filtered_illusts = merge_incremental(filtered_illusts, watermark, search_term, threshold, r18, newest_id, newest_date, crawl_complete, rules=rules, logger=logger)
+
+    return filtered_illusts
+
+def crawl_queries(client, queries, threshold=1000, pages=5, r18=False, no_limit=False, prefetch_pages=1, stop_below_threshold=False, download_pool=None, thumbs=None, exporter=None, rules=None, logger=print):
+    """
+    Crawls several search chains (date windows, popular_desc or users入り
+    queries) and merges their hits by id. 'pages' applies to each chain.
+    With 'stop_below_threshold' a chain ends at the first page where nothing
+    reaches the threshold, since popular_desc pages only get less popular.
+    """
+    hits = {}
+    for number, qs in enumerate(queries, 1):
+        window = f" ({qs['start_date']} to {qs['end_date']})" if qs.get('start_date') else ""
+        logger(f"Searching for '{qs['word']}'{window} sorted by {qs['sort']} with threshold {threshold}...")
         try:
-            json_result = api.search_illust(**next_qs)
-            current_page_number += 1
+            json_result = client.fetch_page(qs, logger=logger)
         except Exception as e:
-            logger(f"API Error fetching next page: {e}")
-            break
+            logger(f"API Error fetching first page: {e}")
+            continue
 
-    logger(f"Found {len(filtered_illusts)} images matching the criteria.")
-    
-    if filtered_illusts:
-        output_file = generate_html(filtered_illusts, search_term, threshold)
-        logger(f"Results saved to: {output_file}")
-        webbrowser.open(f"file://{output_file}")
-    else:
-        logger("No images found with that threshold.")
+        pager = SearchPager(lambda qs: client.fetch_page(qs, logger=logger), client.api.parse_qs, json_result, pages=pages, no_limit=no_limit, logger=logger)
+        page_stream = prefetch(pager, prefetch_pages) if prefetch_pages > 0 else iter(pager)
+        previous_page_ids = set()
+        try:
+            for current_page_number, json_result in page_stream:
+                illusts = json_result.get('illusts', [])
+                current_page_ids = {illust.get('id') for illust in illusts}
+                if is_last_page(illusts, previous_page_ids, current_page_number, logger=logger):
+                    break
+                previous_page_ids = current_page_ids
+
+                logger(f"Processing page {current_page_number} ({len(illusts)} items, {client.limiter.current_rate:.2f} req/s)...")
+                page_best = max((illust.get('total_bookmarks', 0) for illust in illusts), default=0)
+                for illust in pixiv_filter.filter_page(illusts, threshold, r18, rules):
+                    illust_id = illust.get('id')
+                    if illust_id in hits:
+                        continue
+                    record = IllustRecord.from_illust(illust)
+                    hits[illust_id] = record
+                    pixiv_events.emit(logger, pixiv_events.HIT_FOUND, id=illust_id, bookmarks=record.total_bookmarks)
+                    if download_pool:
+                        download_pool.submit(record)
+                    if thumbs:
+                        thumbs.submit(record.thumb_url)
+                    if exporter:
+                        exporter.add(illust)
+                if exporter:
+                    exporter.flush()
+
+                if stop_below_threshold and page_best < threshold:
+                    logger(f"Nothing on page {current_page_number} reaches {threshold} likes. Stopping this query.")
+                    break
+        finally:
+            page_stream.close()
+
+    logger(f"Found {len(hits)} images matching the criteria.")
+    return list(hits.values())
+
+def finish_downloads(download_pool, logger=print):
+    if download_pool:
+        logger("Waiting for downloads to finish...")
+        summary = download_pool.close()
+        logger(f"Downloads: {summary['succeeded']} succeeded, {summary['reused']} reused, {summary['failed']} failed, {summary['bytes'] / (1024 * 1024):.1f} MB")
+
+def start_download_pool(search_term, threshold, download_workers=4, per_host=None, pool_size=None, skip_existing=True, chunk_size=DOWNLOAD_CHUNK_SIZE, logger=print):
+    download_folder = get_unique_download_path(search_term, threshold)
+    session = pixiv_http.get_session(pool_size=pool_size or download_workers)
+    # Files already on disk from earlier runs get linked instead of fetched again
+    index = pixiv_cache.DownloadIndex() if skip_existing else None
+    logger(f"Auto-download enabled ({download_workers} workers). Images will be saved to: {download_folder}")
+    return DownloadPool(download_folder, workers=download_workers, per_host=per_host, chunk_size=chunk_size, session=session, index=index, logger=logger)
+
+def start_exporter(search_term, threshold, export_format, logger=print):
+    import pixiv_export
+
+    path = pixiv_export.export_path(search_term, threshold, export_format)
+    return pixiv_export.ColumnarExporter(path, export_format, logger=logger)
+
+def finish_export(exporter, logger=print):
+    if exporter:
+        path = exporter.close()
+        logger(f"Exported {exporter.count} rows to: {path}")
+
+def run_sorter(search_term, threshold=1000, pages=5, r18=False, delay=2.5, start_page=1, no_limit=False, auto_download=False, download_workers=4, per_host=None, pool_size=None, use_cache=False, cache_path=pixiv_cache.DEFAULT_CACHE_PATH, incremental=False, max_rate=1.0, max_retries=5, prefetch_pages=1, report="html", resume=False, checkpoint_every=10, skip_existing=True, local_thumbs=False, chunk_size=DOWNLOAD_CHUNK_SIZE, api=None, strategy="auto", since=None, until=None, window_days=None, export=None, rules=None, logger=print):
+    client = SearchClient(delay=delay, max_rate=max_rate, max_retries=max_retries, use_cache=use_cache, cache_path=cache_path, api=api, logger=logger)
+
+    # Without a cache every page needs the API, so authenticate up front
+    if not client.cache and not client.perform_login():
+        logger("Could not authenticate. Exiting.")
+        return
+
+    copy_stylesheet(logger=logger)
+
+    download_pool = None
+    if auto_download:
+        download_pool = start_download_pool(search_term, threshold, download_workers, per_host, pool_size, skip_existing=skip_existing, chunk_size=chunk_size, logger=logger)
+    thumbs = pixiv_cache.ThumbnailCache(logger=logger) if local_thumbs else None
+    exporter = start_exporter(search_term, threshold, export, logger=logger) if export else None
+
+    try:
+        try:
+            filtered_illusts = crawl(
+                client, search_term, threshold=threshold, pages=pages, r18=r18, start_page=start_page,
+                no_limit=no_limit, incremental=incremental, prefetch_pages=prefetch_pages,
+                download_pool=download_pool, thumbs=thumbs, resume=resume, checkpoint_every=checkpoint_every,
+                strategy=strategy, since=since, until=until, window_days=window_days, exporter=exporter, rules=rules, logger=logger
+            )
+        finally:
+            client.close()
+            finish_downloads(download_pool, logger=logger)
+            finish_export(exporter, logger=logger)
+
+        write_report(filtered_illusts, search_term, threshold, report=report, thumbs=thumbs, logger=logger)
+    finally:
+        if thumbs:
+            thumbs.close()
+
+def load_batch_file(path, default_threshold=1000):
+    """
+    Reads one search term per line, optionally followed by its own threshold:
+        アズールレーン 5000
+        オリジナル
+    Blank lines and lines starting with '#' are ignored.
+    """
+    terms = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.rsplit(None, 1)
+            if len(parts) == 2 and parts[1].isdigit():
+                terms.append((parts[0], int(parts[1])))
+            else:
+                terms.append((line, default_threshold))
+    return terms
+
+def run_batch(terms, threshold=1000, pages=5, r18=False, delay=2.5, no_limit=False, auto_download=False, download_workers=4, per_host=None, pool_size=None, use_cache=False, cache_path=pixiv_cache.DEFAULT_CACHE_PATH, incremental=False, max_rate=1.0, max_retries=5, prefetch_pages=1, report="html", term_workers=4, resume=False, checkpoint_every=10, skip_existing=True, local_thumbs=False, chunk_size=DOWNLOAD_CHUNK_SIZE, strategy="auto", since=None, until=None, window_days=None, export=None, rules=None, logger=print):
+    """
+    Crawls several search terms concurrently over one login and one shared
+    rate limit. 'terms' holds search terms or (search_term, threshold) pairs.
+    Hits are deduplicated by illust id into one combined report; exports
+    are written per term.
+    """
+    terms = [term if isinstance(term, tuple) else (term, threshold) for term in terms]
+    if not terms:
+        logger("[!] No search terms given.")
+        return
+
+    client = SearchClient(delay=delay, max_rate=max_rate, max_retries=max_retries, use_cache=use_cache, cache_path=cache_path, logger=logger)
+    if not client.cache and not client.perform_login():
+        logger("Could not authenticate. Exiting.")
+        return
+
+    copy_stylesheet(logger=logger)
+
+    thresholds = sorted({term_threshold for _, term_threshold in terms})
+    threshold_label = f"{thresholds[0]}" if len(thresholds) == 1 else f"{thresholds[0]}-{thresholds[-1]}"
+
+    download_pool = None
+    if auto_download:
+        download_pool = start_download_pool("batch", threshold_label, download_workers, per_host, pool_size, skip_existing=skip_existing, chunk_size=chunk_size, logger=logger)
+    thumbs = pixiv_cache.ThumbnailCache(logger=logger) if local_thumbs else None
+
+    logger(f"Batch search: {len(terms)} terms, {term_workers} at a time.")
+
+    def crawl_term(search_term, term_threshold):
+        term_logger = pixiv_events.prefixed(logger, f"[{search_term}] ", term=search_term)
+        exporter = start_exporter(search_term, term_threshold, export, logger=term_logger) if export else None
+        try:
+            return crawl(
+                client, search_term, threshold=term_threshold, pages=pages, r18=r18,
+                no_limit=no_limit, incremental=incremental, prefetch_pages=prefetch_pages,
+                download_pool=download_pool, thumbs=thumbs, resume=resume, checkpoint_every=checkpoint_every,
+                strategy=strategy, since=since, until=until, window_days=window_days, exporter=exporter, rules=rules, logger=term_logger
+            )
+        except Exception as e:
+            term_logger(f"[!] Crawl failed: {e}")
+            return []
+        finally:
+            finish_export(exporter, logger=term_logger)
+
+    combined = {}
+    try:
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, term_workers), thread_name_prefix="batch") as executor:
+                futures = [executor.submit(crawl_term, term, term_threshold) for term, term_threshold in terms]
+                for future in futures:
+                    for illust in future.result():
+                        # The same work often appears under several watched tags
+                        combined.setdefault(illust.id, illust)
+        finally:
+            client.close()
+            finish_downloads(download_pool, logger=logger)
+
+        logger(f"Batch finished: {len(combined)} unique images across {len(terms)} terms.")
+        write_report(list(combined.values()), f"{len(terms)} tags", threshold_label, report=report, name="batch", thumbs=thumbs, logger=logger)
+    finally:
+        if thumbs:
+            thumbs.close()
 
 def main():
     parser = argparse.ArgumentParser(description="Pixiv Sorter - Find popular images.")
@@ -527,19 +1662,198 @@ def main():
     parser.add_argument("--threshold", type=int, default=1000, help="Minimum likes threshold (default: 1000)")
     parser.add_argument("--pages", type=int, default=5, help="Number of pages to search (default: 5)")
     parser.add_argument("--r18", action="store_true", help="Include R-18 content")
-    parser.add_argument("--delay", type=float, default=2.5, help="Delay between pages in seconds (default: 2.5)")
+    parser.add_argument("--delay", type=float, default=2.5, help="Starting delay between pages in seconds (default: 2.5)")
+    parser.add_argument("--max_rate", type=float, default=1.0, help="Ceiling for the adaptive page request rate in requests/second (default: 1.0)")
+    parser.add_argument("--max_retries", type=int, default=5, help="Retries per page on throttling or API errors (default: 5)")
+    parser.add_argument("--report", choices=("html", "gallery"), default="html", help="Single-page HTML report, or a paged gallery with JSON data shards for very large results (default: html)")
+    parser.add_argument("--prefetch", type=int, default=1, choices=(0, 1, 2), help="Search pages to fetch ahead while filtering (default: 1, 0 disables)")
     parser.add_argument("--start_page", type=int, default=1, help="Start search from this page number (default: 1)")
     parser.add_argument("--no_limit", action="store_true", help="Keep searching until no more results (overrides --pages)")
+    parser.add_argument("--auto_download", action="store_true", help="Download originals of matching images")
+    parser.add_argument("--download_workers", type=int, default=4, help="Number of parallel download workers (default: 4)")
+    parser.add_argument("--per_host", type=int, default=None, help="Max concurrent downloads per image host (default: same as --download_workers, or --max_inflight with --engine async)")
+    parser.add_argument("--redownload", action="store_true", help="Fetch originals again even if an earlier run already downloaded them")
+    parser.add_argument("--chunk_kb", type=int, default=DOWNLOAD_CHUNK_SIZE // 1024, help=f"Download read size in KiB (default: {DOWNLOAD_CHUNK_SIZE // 1024})")
+    parser.add_argument("--pool_size", type=int, default=None, help="HTTP keep-alive connections per host (default: same as --download_workers)")
+    parser.add_argument("--local_thumbs", action="store_true", help="Download card thumbnails into cache/thumbs and point the report at them, so it loads offline")
+    parser.add_argument("--cache", action="store_true", help="Serve fresh search pages from the local metadata cache and store new ones")
+    parser.add_argument("--cache_path", default=pixiv_cache.DEFAULT_CACHE_PATH, help=f"Metadata cache file (default: {pixiv_cache.DEFAULT_CACHE_PATH})")
+    parser.add_argument("--from_cache", action="store_true", help="Render the report from the metadata cache only (no login, no API calls)")
+    parser.add_argument("--incremental", action="store_true", help="Only crawl illustrations newer than the last incremental run and merge them with its results")
+    parser.add_argument("--batch", metavar="FILE", help="Search every term in FILE (one per line, optionally followed by a threshold) over one login")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted crawl of the same search from its last checkpoint")
+    parser.add_argument("--checkpoint_every", type=int, default=10, help="Save a resumable checkpoint every N pages (default: 10, 0 disables)")
+    parser.add_argument("--strategy", choices=pixiv_search.STRATEGIES, default="auto", help="Query shape: 'scan' pages everything newest first; 'popular' sorts by popularity and stops early (premium only); 'users_tag' adds the matching '<N>users入り' tag, which only finds works the community has tagged; 'auto' uses popular on premium accounts, otherwise scan (default: auto)")
+    parser.add_argument("--since", metavar="YYYY-MM-DD", type=pixiv_search.iso_date, help="Only search works posted on or after this date")
+    parser.add_argument("--until", metavar="YYYY-MM-DD", type=pixiv_search.iso_date, help="Only search works posted on or before this date")
+    parser.add_argument("--window_days", type=int, default=None, help="With --since, split the date range into windows of N days, each crawled as its own query (gets past the per-query result ceiling on big tags)")
+    parser.add_argument("--tags", nargs="+", metavar="TAG", default=(), help="Only keep works that also carry all of these tags")
+    parser.add_argument("--exclude_tags", nargs="+", metavar="TAG", default=(), help="Drop works carrying any of these tags")
+    parser.add_argument("--min_per_day", type=float, default=0.0, help="Also keep works below --threshold that average at least this many likes per day since posting (the popular and users_tag strategies only reach works near the threshold)")
+    parser.add_argument("--export", choices=("parquet", "arrow", "csv"), help="Also write the matches to export/<term> <threshold>.<format> for analysis, page by page as the crawl runs (parquet and arrow need pyarrow; falls back to csv)")
+    parser.add_argument("--shards", type=int, default=1, help="Split the tag's history (--since/--until, default: all of it) into --window_days windows (default: 30) and crawl them in N processes sharing the rate budget (default: 1, no sharding)")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads", help="Crawl with worker threads, or run downloads and thumbnails as asyncio tasks on one event loop; async fetches images with aiohttp when it is installed (pip install aiohttp) (default: threads)")
+    parser.add_argument("--max_inflight", type=int, default=64, help="Image requests in flight at once with --engine async (default: 64)")
+    parser.add_argument("--events", metavar="FILE", help="Append structured progress events to FILE as JSON lines")
+    parser.add_argument("--metrics", metavar="FILE", help="Write Prometheus-style counters to FILE when the run ends and print a throughput summary")
+    parser.add_argument("--term_workers", type=int, default=4, help="Search terms crawled at the same time in batch mode (default: 4)")
     
     args = parser.parse_args()
 
     # If args are missing, ask interactively
-    if not args.search_term:
+    if not args.batch and not args.search_term:
         args.search_term = input("Enter search term: ").strip()
         if not args.search_term:
             print("Search term is required.")
             return
 
+    logger = print
+    exporter = None
+    metrics = None
+    if args.events or args.metrics:
+        logger = pixiv_events.EventBus()
+        logger.subscribe(pixiv_events.print_logs)
+        if args.events:
+            exporter = logger.subscribe(pixiv_events.JsonlExporter(args.events))
+        if args.metrics:
+            metrics = logger.subscribe(pixiv_events.Metrics())
+
+    try:
+        run_from_args(args, logger)
+    finally:
+        if exporter:
+            exporter.close()
+        if metrics:
+            metrics.write_prometheus(args.metrics)
+            print(metrics.summary())
+
+def filter_rules_from_args(args):
+    rules = pixiv_filter.FilterRules(
+        include_tags=args.tags, exclude_tags=args.exclude_tags,
+        since=args.since, until=args.until, min_per_day=args.min_per_day
+    )
+    return rules or None
+
+def run_from_args(args, logger=print):
+    rules = filter_rules_from_args(args)
+    if args.batch:
+        if args.shards > 1:
+            logger("[!] --shards applies to single-term crawls. Ignoring it for --batch.")
+        run_batch(
+            terms=load_batch_file(args.batch, default_threshold=args.threshold),
+            threshold=args.threshold,
+            pages=args.pages,
+            r18=args.r18,
+            delay=args.delay,
+            no_limit=args.no_limit,
+            auto_download=args.auto_download,
+            download_workers=args.download_workers,
+            per_host=args.per_host,
+            pool_size=args.pool_size,
+            use_cache=args.cache,
+            cache_path=args.cache_path,
+            incremental=args.incremental,
+            max_rate=args.max_rate,
+            max_retries=args.max_retries,
+            prefetch_pages=args.prefetch,
+            report=args.report,
+            term_workers=args.term_workers,
+            resume=args.resume,
+            checkpoint_every=args.checkpoint_every,
+            skip_existing=not args.redownload,
+            local_thumbs=args.local_thumbs,
+            chunk_size=args.chunk_kb * 1024,
+            strategy=args.strategy,
+            since=args.since,
+            until=args.until,
+            window_days=args.window_days,
+            export=args.export,
+            rules=rules,
+            logger=logger
+        )
+        return
+
+    if args.from_cache:
+        render_from_cache(
+            search_term=args.search_term,
+            threshold=args.threshold,
+            r18=args.r18,
+            cache_path=args.cache_path,
+            report=args.report,
+            local_thumbs=args.local_thumbs,
+            rules=rules,
+            logger=logger
+        )
+        return
+
+    if args.shards > 1:
+        if args.incremental or args.resume:
+            logger("[!] --incremental and --resume need a single crawl. Ignoring --shards.")
+        else:
+            import pixiv_shard
+            pixiv_shard.run_sharded(
+                search_term=args.search_term,
+                threshold=args.threshold,
+                pages=args.pages,
+                r18=args.r18,
+                delay=args.delay,
+                no_limit=args.no_limit,
+                shards=args.shards,
+                since=args.since,
+                until=args.until,
+                window_days=args.window_days,
+                auto_download=args.auto_download,
+                download_workers=args.download_workers,
+                per_host=args.per_host,
+                pool_size=args.pool_size,
+                use_cache=args.cache,
+                cache_path=args.cache_path,
+                max_rate=args.max_rate,
+                max_retries=args.max_retries,
+                prefetch_pages=args.prefetch,
+                report=args.report,
+                skip_existing=not args.redownload,
+                local_thumbs=args.local_thumbs,
+                chunk_size=args.chunk_kb * 1024,
+                strategy=args.strategy,
+                export=args.export,
+                rules=rules,
+                logger=logger
+            )
+            return
+
+    if args.engine == "async":
+        if args.incremental or args.resume:
+            logger("[!] --incremental and --resume need the threaded engine. Using --engine threads.")
+        elif args.strategy not in ("auto", "scan") or args.since or args.until:
+            logger("[!] --strategy, --since and --until need the threaded engine. Using --engine threads.")
+        else:
+            import pixiv_async
+            pixiv_async.run_sorter_blocking(
+                search_term=args.search_term,
+                threshold=args.threshold,
+                pages=args.pages,
+                r18=args.r18,
+                delay=args.delay,
+                start_page=args.start_page,
+                no_limit=args.no_limit,
+                auto_download=args.auto_download,
+                max_inflight=args.max_inflight,
+                per_host=args.per_host,
+                skip_existing=not args.redownload,
+                chunk_size=args.chunk_kb * 1024,
+                use_cache=args.cache,
+                cache_path=args.cache_path,
+                max_rate=args.max_rate,
+                max_retries=args.max_retries,
+                report=args.report,
+                local_thumbs=args.local_thumbs,
+                export=args.export,
+                rules=rules,
+                logger=logger
+            )
+            return
+
     run_sorter(
         search_term=args.search_term,
         threshold=args.threshold,
@@ -547,7 +1861,30 @@ def main():
         r18=args.r18,
         delay=args.delay,
         start_page=args.start_page,
-        no_limit=args.no_limit
+        no_limit=args.no_limit,
+        auto_download=args.auto_download,
+        download_workers=args.download_workers,
+        per_host=args.per_host,
+        pool_size=args.pool_size,
+        use_cache=args.cache,
+        cache_path=args.cache_path,
+        incremental=args.incremental,
+        max_rate=args.max_rate,
+        max_retries=args.max_retries,
+        prefetch_pages=args.prefetch,
+        report=args.report,
+        resume=args.resume,
+        checkpoint_every=args.checkpoint_every,
+        skip_existing=not args.redownload,
+        local_thumbs=args.local_thumbs,
+        chunk_size=args.chunk_kb * 1024,
+        strategy=args.strategy,
+        since=args.since,
+        until=args.until,
+        window_days=args.window_days,
+        export=args.export,
+        rules=rules,
+        logger=logger
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+STATE_DIR = "state"
+
+def state_path(kind, *key_parts):
+    """
+    Returns 'state/<kind>/<readable name>-<hash>.json' for a key such as
+    (search_term, r18). The hash keeps names unique after cleaning.
+    """
+    key = "|".join(str(part) for part in key_parts)
+    safe = "".join([c for c in key.replace("|", " ") if c.isalnum() or c in (' ', '_', '-')]).strip()[:60]
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(STATE_DIR, kind, f"{safe}-{digest}.json")
+
+def load_state(path, default=None):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_state(path, data):
+    """
+    Writes JSON atomically (temp file + rename) so a crash mid-write never
+    leaves a truncated state file behind.
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def delete_state(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def load_watermark(search_term, r18):
+    """
+    Returns the last incremental run of (search_term, r18):
+    {'newest_id', 'newest_date', 'hits'} or None.
+    """
+    return load_state(state_path("incremental", search_term, r18))
+
+def save_watermark(search_term, r18, newest_id, newest_date, hits):
+    save_state(state_path("incremental", search_term, r18), {
+        "search_term": search_term,
+        "r18": r18,
+        "newest_id": newest_id,
+        "newest_date": newest_date,
+        "hits": hits,
+    })
+
+class CrawlCheckpoint:
+    """
+    Periodic snapshot of a crawl's position so an interrupted run can resume.
+    The position is a small JSON file; hits are appended to a JSONL sidecar
+    so each save only writes what is new since the last one.
+    """
+    def __init__(self, *key_parts):
+        self.path = state_path("checkpoints", *key_parts)
+        self.hits_path = self.path[:-len(".json")] + ".hits.jsonl"
+        self.saved_hits = 0
+
+    def load(self):
+        """
+        Returns (position, hits) from the last save, or None if there is none.
+        """
+        position = load_state(self.path)
+        if not position:
+            return None
+
+        hits = []
+        if os.path.exists(self.hits_path):
+            with open(self.hits_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if len(hits) >= position["hit_count"]:
+                        break
+                    hits.append(json.loads(line))
+        if len(hits) < position["hit_count"]:
+            return None
+
+        # Drop hits appended after the last position was written
+        with open(self.hits_path, "w", encoding="utf-8") as f:
+            for hit in hits:
+                f.write(json.dumps(hit, ensure_ascii=False) + "\n")
+        self.saved_hits = len(hits)
+        return position, hits
+
+    def save(self, position, hits):
+        folder = os.path.dirname(self.path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        with open(self.hits_path, "a", encoding="utf-8") as f:
+            for hit in hits[self.saved_hits:]:
+                # Hits are IllustRecords or plain dicts
+                if hasattr(hit, "to_dict"):
+                    hit = hit.to_dict()
+                f.write(json.dumps(hit, ensure_ascii=False) + "\n")
+        self.saved_hits = len(hits)
+        save_state(self.path, dict(position, hit_count=len(hits)))
+
+    def clear(self):
+        delete_state(self.path)
+        delete_state(self.hits_path)
+        self.saved_hits = 0
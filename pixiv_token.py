@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+import pixiv_state
+
+DEFAULT_TOKEN_PATH = os.path.join(pixiv_state.STATE_DIR, "auth_token.json")
+# Refresh the access token this many seconds before it expires
+REFRESH_MARGIN = 300
+# Pixiv access tokens last an hour; used when the response has no expires_in
+DEFAULT_EXPIRES_IN = 3600
+RETRY_INTERVAL = 60
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on '<path>.lock', shared by every process that
+    locks the same path.
+    """
+    lock_path = f"{path}.lock"
+    folder = os.path.dirname(lock_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(lock_path, "a+") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK itself retries for about ten seconds before giving up
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def save_refresh_token(path, refresh_token):
+    """
+    Replaces the refresh token file atomically, under its lock.
+    """
+    with file_lock(path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(refresh_token)
+        os.replace(tmp_path, path)
+
+def _field(obj, *keys):
+    # Walks the parsed OAuth response (a dict-like JsonDict, or None from test APIs)
+    for key in keys:
+        if obj is None:
+            return None
+        obj = obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+    return obj
+
+class AuthManager:
+    """
+    Logs an AppPixivAPI in through a token cache on disk. A cached access
+    token is reused until shortly before it expires, so short runs skip the
+    OAuth round-trip, and a background timer refreshes it ahead of expiry.
+    The cache is file-locked: parallel processes refresh once and share
+    the result.
+    """
+    def __init__(self, api, refresh_token, path=DEFAULT_TOKEN_PATH, margin=REFRESH_MARGIN, logger=print):
+        self.api = api
+        self.refresh_token = refresh_token
+        self.path = path
+        self.margin = margin
+        self.logger = logger
+        self.expires_at = 0
+        self.is_premium = None
+        self.lock = threading.Lock()
+        self.timer = None
+        self.closed = False
+
+    def _usable(self, entry):
+        # Entries from another account (a different refresh token) are ignored
+        return bool(entry) and self.refresh_token in (entry.get("refresh_token"), entry.get("source_token"))
+
+    def _adopt(self, entry):
+        self.api.set_auth(entry["access_token"], entry["refresh_token"])
+        self.api.user_id = entry.get("user_id", 0)
+        self.refresh_token = entry["refresh_token"]
+        self.expires_at = entry["expires_at"]
+        self.is_premium = entry.get("is_premium")
+
+    def _refresh(self):
+        token = self.api.auth(refresh_token=self.refresh_token)
+        expires_in = _field(token, "response", "expires_in") or DEFAULT_EXPIRES_IN
+        is_premium = _field(token, "response", "user", "is_premium")
+        entry = {
+            "source_token": self.refresh_token,
+            "access_token": self.api.access_token,
+            "refresh_token": self.api.refresh_token or self.refresh_token,
+            "user_id": self.api.user_id,
+            "is_premium": None if is_premium is None else bool(is_premium),
+            "expires_at": time.time() + expires_in,
+        }
+        pixiv_state.save_state(self.path, entry)
+        return entry
+
+    def login(self, force=False):
+        """
+        Sets the API's tokens from the cache or, when the cached token is
+        missing or about to expire, from the OAuth endpoint. With 'force'
+        (the API rejected our token) the cache is only used if another
+        process has replaced that token since. Returns True if the cached
+        token was used; OAuth errors propagate.
+        """
+        with self.lock, file_lock(self.path):
+            entry = pixiv_state.load_state(self.path)
+            cached = self._usable(entry) and entry["expires_at"] - self.margin > time.time()
+            if cached and force and entry["access_token"] == self.api.access_token:
+                cached = False
+            self._adopt(entry if cached else self._refresh())
+        self._schedule(self.expires_at - self.margin - time.time())
+        return cached
+
+    def _schedule(self, delay):
+        with self.lock:
+            if self.closed:
+                return
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(max(1.0, delay), self._background_refresh)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _background_refresh(self):
+        try:
+            self.login(force=True)
+        except Exception as e:
+            self.logger(f"  [!] Background token refresh failed ({e}). Retrying in {RETRY_INTERVAL}s...")
+            self._schedule(RETRY_INTERVAL)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.timer:
+                self.timer.cancel()